@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+
+async def read_http(reader:asyncio.StreamReader) -> tuple:
+    '''(first line, headers, body) of the next HTTP/1.1 message on reader, None at the end of the stream'''
+    first = await reader.readline()
+    if not first:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return first.decode('latin-1').rstrip('\r\n'), headers, body
+
+
+class AppEndpoint:
+    '''A stand-in for the HTTP/JSON status endpoints of the apps, that answers for any number of them.
+
+    POST /status with a JSON list of app paths answers {path: {"state": ...}}
+    for each of them that is alive. state is null unless something told the
+    endpoint which state the app is in (POST /state with {path: state}). The
+    apps listed in a POST /crash stop answering until a POST /revive. The
+    connections are kept alive, as a real client would expect.
+    '''
+    def __init__(self, host:str='127.0.0.1', port:int=0):
+        self.host = host
+        self.port = port   # 0 picks a free one, see self.port once started
+        self.states = {}   # type: dict[str, str]
+        self.dead = set()  # type: set[str]
+        self.requests = 0
+        self.server = None
+        self.connections = {} # type: dict[asyncio.Task, asyncio.StreamWriter] open connections, by the task serving them
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        connections = dict(self.connections)
+        for writer in connections.values():
+            writer.close() # idle keep-alive connections would otherwise wait forever
+        await asyncio.gather(*connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    @property
+    def address(self) -> str:
+        return f'{self.host}:{self.port}'
+
+    async def handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                message = await read_http(reader)
+                if message is None:
+                    break
+                first, headers, body = message
+                method, target, _ = first.split(' ', 2)
+                status, reply = self.route(method, target, json.loads(body) if body else None)
+                data = json.dumps(reply, separators=(',', ':')).encode()
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n'.encode()
+                    + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    def route(self, method:str, target:str, request) -> tuple:
+        self.requests += 1
+        if method != 'POST':
+            return '405 Method Not Allowed', {'error': f'{method} not allowed'}
+        if target == '/status':
+            dead, states = self.dead, self.states
+            return '200 OK', {path: {'state': states.get(path)} for path in request if path not in dead}
+        if target == '/state':
+            self.states.update(request)
+        elif target == '/crash':
+            self.dead.update(request)
+        elif target == '/revive':
+            self.dead.difference_update(request)
+        else:
+            return '404 Not Found', {'error': f'No {target}'}
+        return '200 OK', {}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Answers the health polls of any number of simulated apps')
+    parser.add_argument('address', help='host:port to listen on')
+    args = parser.parse_args()
+    host, _, port = args.address.rpartition(':')
+
+    async def serve() -> None:
+        endpoint = AppEndpoint(host or '127.0.0.1', int(port))
+        await endpoint.start()
+        await endpoint.server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,330 @@
+import hashlib
+import json
+import os
+import pickle
+from array import array
+
+
+class Topology:
+    '''The app tree as described in a configuration file, flattened into parallel arrays.
+
+    Nodes are numbered breadth first, so the children of node i are the
+    contiguous indices first_child[i] to first_child[i]+child_count[i].
+
+    The configuration is a JSON tree of {"name": ..., "children": [...]} entries
+    of any depth. An entry with "range": [start, stop] stands for one node per
+    number in the range, named with str.format, e.g. {"name": "wib_{:03d}", "range": [0, 8]}.
+    '''
+    __slots__ = ('names', 'first_child', 'child_count')
+
+    def __init__(self, names:list[str], first_child:array, child_count:array):
+        self.names = names
+        self.first_child = first_child
+        self.child_count = child_count
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def children(self, i:int) -> range:
+        return range(self.first_child[i], self.first_child[i] + self.child_count[i])
+
+    @staticmethod
+    def expand(entry:dict) -> list[str]:
+        if 'range' in entry:
+            return [entry['name'].format(i) for i in range(*entry['range'])]
+        return [entry['name']]
+
+    @classmethod
+    def parse(cls, config:dict) -> 'Topology':
+        names = [config['name']]
+        first_child = array('l')
+        child_count = array('l')
+        entries = [config]  # the config entry each node was made from
+        i = 0
+        while i < len(names):
+            first_child.append(len(names))
+            count = 0
+            for child in entries[i].get('children', []):
+                for name in cls.expand(child):
+                    names.append(name)
+                    entries.append(child)
+                    count += 1
+            child_count.append(count)
+            i += 1
+        return cls(names, first_child, child_count)
+
+
+_loaded = {} # type: dict[str, Topology] file digest -> topology, shared by the RCs of this process
+
+def load_topology(filename:str, cache_dir:str=os.path.expanduser('~/.cache/text-rc')) -> Topology:
+    '''Parses a topology file, or loads it from the cache if this exact file was parsed before'''
+    with open(filename, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if digest in _loaded:
+        return _loaded[digest] # topologies are never modified, partitions can share them
+    cache_file = os.path.join(cache_dir, f'topology-{digest}.pickle')
+    try:
+        with open(cache_file, 'rb') as f:
+            topology = _loaded[digest] = pickle.load(f)
+            return topology
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    topology = _loaded[digest] = Topology.parse(json.loads(data))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(topology, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass # the cache is only an optimisation
+    return topology
+
+
+class AppNode:
+    '''One node of the app tree. Parents also count how many of their children are in each state'''
+    __slots__ = ('name', 'path', 'parent', 'children', 'state', 'child_states', 'pending')
+
+    def __init__(self, name:str, path:str, parent, state:str, pending:int=None):
+        self.name = name
+        self.path = path
+        self.parent = parent
+        self.children = []     # type: list[AppNode]
+        self.state = state
+        self.child_states = {} # type: dict[str, int]
+        self.pending = pending # topology index of the node if its children are not materialised yet
+
+    def __repr__(self) -> str:
+        return f'AppNode({self.path!r}, {self.state!r})'
+
+    @property
+    def depth(self) -> int:
+        return self.path.count('/')
+
+    def is_leaf(self) -> bool:
+        return not self.children and self.pending is None
+
+
+class AppRegistry:
+    '''The app tree, indexed by path (e.g. np04_coldbox/daq/dataflow2).
+
+    Looking up an app is a dict access, and changing its state only walks up
+    its ancestors for as long as their aggregated state actually changes. The
+    mutating methods return the nodes whose state changed, so that the callers
+    can pass on deltas rather than the whole tree.
+
+    When built from a Topology, subtrees are only materialised when something
+    asks for them. Until then, the unexpanded node stands for its whole subtree,
+    which is always in the same state as it.
+    '''
+    MIXED = 'mixed' # aggregated state of a node whose children disagree
+
+    def __init__(self, root:str, state:str='none', topology:Topology=None):
+        self.topology = topology
+        self.root = AppNode(root, root, None, state, 0 if topology else None)
+        self.nodes = {root: self.root} # type: dict[str, AppNode]
+
+    @classmethod
+    def from_topology(cls, topology:Topology, state:str='none', expand_depth:int=2, root:str=None) -> 'AppRegistry':
+        '''root renames the root of the topology, so that several trees made from it have different paths'''
+        registry = cls(root or topology.names[0], state, topology)
+        level = [registry.root]
+        for _ in range(expand_depth):
+            level = [child for node in level for child in registry.expand(node.path)]
+        return registry
+
+    def __contains__(self, path:str) -> bool:
+        return path in self.nodes
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def get(self, path:str) -> AppNode:
+        node = self.nodes.get(path)
+        if node is None:
+            node = self.materialise(path)
+        if node is None:
+            raise KeyError(f'No app \'{path}\' in the tree')
+        return node
+
+    def materialise(self, path:str) -> AppNode:
+        '''Expands the unexpanded ancestors of path, returns its node or None if there is no such app'''
+        names = path.split('/')
+        for depth in range(1, len(names)):
+            parent = self.nodes.get('/'.join(names[:depth]))
+            if parent is None:
+                return None
+            self.expand(parent.path)
+        return self.nodes.get(path)
+
+    def expand(self, path:str) -> list[AppNode]:
+        '''Materialises the children of an unexpanded node, returns them'''
+        node = self.nodes[path]
+        if node.pending is None:
+            return []
+        topology = self.topology
+        for i in topology.children(node.pending):
+            child_path = f'{path}/{topology.names[i]}'
+            child = AppNode(topology.names[i], child_path, node, node.state, i if topology.child_count[i] else None)
+            node.children.append(child)
+            self.nodes[child_path] = child
+        node.pending = None
+        if node.children:
+            node.child_states = {node.state: len(node.children)}
+        return node.children
+
+    def aggregate(self, node:AppNode) -> str:
+        if not node.child_states:
+            return node.state
+        if len(node.child_states) == 1:
+            return next(iter(node.child_states))
+        return self.MIXED
+
+    def _propagate(self, parent:AppNode, old:str, new:str, changed:list) -> None:
+        '''Moves one child of parent from state old to new (None meaning absent) and updates the ancestors'''
+        while parent is not None:
+            counts = parent.child_states
+            if old is not None:
+                counts[old] -= 1
+                if not counts[old]:
+                    del counts[old]
+            if new is not None:
+                counts[new] = counts.get(new, 0) + 1
+            old, new = parent.state, self.aggregate(parent)
+            if old == new:
+                return
+            parent.state = new
+            changed.append(parent)
+            parent = parent.parent
+
+    def add(self, path:str, state:str='none') -> list[AppNode]:
+        '''Adds the app at path, and any missing parent on the way'''
+        changed = []
+        parent = None
+        prefix = ''
+        for name in path.split('/'):
+            prefix = f'{prefix}/{name}' if prefix else name
+            node = self.nodes.get(prefix)
+            if node is None and parent is not None and parent.pending is not None:
+                self.expand(parent.path)
+                node = self.nodes.get(prefix)
+            if node is None:
+                if parent is None:
+                    raise KeyError(f'\'{path}\' is not under the root \'{self.root.path}\'')
+                node = AppNode(name, prefix, parent, state)
+                parent.children.append(node)
+                self.nodes[prefix] = node
+                changed.append(node)
+                self._propagate(parent, None, state, changed)
+            parent = node
+        return changed
+
+    def remove(self, path:str) -> list[AppNode]:
+        '''Removes the node at path and everything below it'''
+        node = self.get(path)
+        if node.parent is None:
+            raise ValueError('Cannot remove the root of the app tree')
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            del self.nodes[n.path]
+            stack.extend(n.children)
+        node.parent.children.remove(node)
+        changed = []
+        self._propagate(node.parent, node.state, None, changed)
+        return changed
+
+    def set_state(self, path:str, state:str) -> list[AppNode]:
+        node = self.get(path)
+        if node.state == state:
+            return []
+        old = node.state
+        node.state = state
+        changed = [node]
+        self._propagate(node.parent, old, state, changed)
+        return changed
+
+    def set_states(self, states:dict) -> list[AppNode]:
+        '''Sets many states at once, each changed node is only returned once'''
+        changed = {}
+        for path, state in states.items():
+            for node in self.set_state(path, state):
+                changed[node.path] = node
+        return list(changed.values())
+
+    def leaves(self, path:str=None) -> list[AppNode]:
+        '''The materialised nodes without children, unexpanded subtrees included'''
+        stack = [self.get(path) if path else self.root]
+        leaves = []
+        while stack:
+            node = stack.pop()
+            if node.children:
+                stack.extend(reversed(node.children))
+            else:
+                leaves.append(node)
+        return leaves
+
+    def app_paths(self, path:str=None) -> list[str]:
+        '''The paths of all the apps (leaves) under path, including the ones not materialised yet'''
+        paths = []
+        for node in self.leaves(path):
+            if node.pending is None:
+                paths.append(node.path)
+                continue
+            topology = self.topology
+            stack = [(node.pending, node.path)]
+            while stack:
+                i, prefix = stack.pop()
+                if not topology.child_count[i]:
+                    paths.append(prefix)
+                for child in reversed(topology.children(i)):
+                    stack.append((child, f'{prefix}/{topology.names[child]}'))
+        return paths
+
+    def state_of(self, path:str) -> str:
+        '''The state of the app at path, without materialising it'''
+        node = self.nodes.get(path)
+        while node is None and '/' in path:
+            path = path.rpartition('/')[0]
+            node = self.nodes.get(path)
+        if node is None:
+            raise KeyError(f'No app \'{path}\' in the tree')
+        return node.state
+
+    def snapshot(self) -> dict:
+        '''Enough to rebuild the registry elsewhere: its topology, which nodes are materialised and the leaf states'''
+        expanded = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                expanded.append(node.path) # parents always come before their children
+                stack.extend(reversed(node.children))
+        topology = self.topology
+        return {
+            'root': self.root.name,
+            'topology': [topology.names, topology.first_child.tolist(), topology.child_count.tolist()],
+            'expanded': expanded,
+            'states': {node.path: node.state for node in self.leaves()},
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot:dict) -> 'AppRegistry':
+        names, first_child, child_count = snapshot['topology']
+        registry = cls(snapshot['root'], 'none', Topology(names, array('l', first_child), array('l', child_count)))
+        for path in snapshot['expanded']:
+            registry.expand(path)
+        registry.set_states(snapshot['states'])
+        return registry
+
+    def to_dict(self, node:AppNode=None) -> dict:
+        '''The tree in the nested {'name': {'state':..., 'children': [...]}} format'''
+        node = node or self.root
+        return {
+            node.name: {
+                'state': node.state,
+                'children': [self.to_dict(child) for child in node.children]
+            }
+        }
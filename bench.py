@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+
+from rc import RC
+from simulation import SimulatedApps, synthetic_topology
+
+# Goes through every command of RC.paramdict, and back to 'none' twice
+SEQUENCE = ['boot', 'conf', 'start', 'enable_trigger', 'disable_trigger', 'drain_dataflow', 'stop_trigger_sources',
+            'stop', 'scrap', 'terminate', 'boot', 'start_run', 'shutdown']
+
+SEARCHES = {
+    'text':      'fragments',
+    'no_match':  'no such line anywhere',
+    'level':     'level:warning',
+    'app':       'app:{root}/daq/df0001',
+    'combined':  'level:warning queue',
+}
+
+FULL = {
+    'transition_apps': [100, 1000, 10000], 'transition_repeat': 3,
+    'ingest_records': [10000, 50000], 'search_history': [10000, 100000], 'search_repeat': 5,
+    'tree_apps': [1000, 10000], 'tree_repeat': 5, 'idle_seconds': 3,
+}
+QUICK = {
+    'transition_apps': [100, 1000], 'transition_repeat': 1,
+    'ingest_records': [10000], 'search_history': [10000], 'search_repeat': 3,
+    'tree_apps': [1000], 'tree_repeat': 3, 'idle_seconds': 1,
+}
+
+
+class Results:
+    '''Named measurements, each with its unit and whether lower or higher is better'''
+    def __init__(self):
+        self.results = {} # type: dict[str, dict]
+
+    def add(self, name:str, value:float, unit:str='s', better:str='lower') -> None:
+        self.results[name] = {'value': value, 'unit': unit, 'better': better}
+        print(f'{name:55} {value:14.6g} {unit}', file=sys.stderr, flush=True)
+
+
+def quiet_rc(**kwargs) -> RC:
+    '''An RC on simulated apps that answer at once, so only the controller's own time is measured'''
+    rc = RC(run_db=None, backend=SimulatedApps(latency=0), **kwargs)
+    rc.log.propagate = False
+    rc.log.addHandler(logging.NullHandler())
+    return rc
+
+
+async def bench_transitions(results:Results, sizes:list[int], repeat:int) -> None:
+    '''End to end time of each command, from submit() to done, against the number of apps'''
+    for apps in sizes:
+        rc = quiet_rc(topology=synthetic_topology(apps), partition=f'bench{apps}')
+        times = {}
+        for _ in range(repeat):
+            for command in SEQUENCE:
+                start = time.perf_counter()
+                await rc.submit(command)
+                times.setdefault(command, []).append(time.perf_counter() - start)
+        await rc.scheduler.close()
+        for command, samples in times.items():
+            results.add(f'transition.{command}.apps={apps}', statistics.median(samples))
+
+
+def timed(function, repeat:int) -> float:
+    '''Median time of function() over repeat calls'''
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+async def settle(display, timeout:float=120) -> float:
+    '''Waits until the log display stops growing, returns when it last grew'''
+    store, formatter = display.store, display.formatter
+    last_seq, last_change = store.next_seq, time.perf_counter()
+    while time.perf_counter() - last_change < 0.5 and time.perf_counter() - last_change < timeout:
+        await asyncio.sleep(0.01)
+        if store.next_seq != last_seq or display.log_queue.qsize() or formatter.ready:
+            last_seq, last_change = store.next_seq, time.perf_counter()
+    return last_change
+
+
+async def bench_logs(results:Results, app, rc, config:dict) -> None:
+    '''Log records through the whole pipeline of the TUI, then searches against the history size'''
+    import tui
+    display = app.query_one(tui.LogDisplay)
+    logs = app.query_one(tui.Logs)
+    paths = rc.apps.app_paths()
+    messages = ['Received {} fragments from link {}', 'Queue {} at {}% occupancy', 'Heartbeat {} from {}']
+
+    for records in config['ingest_records']:
+        await settle(display)
+        dropped = display.ingest.dropped
+        start = time.perf_counter()
+        for i in range(records):
+            level = logging.WARNING if i % 50 == 0 else logging.INFO
+            rc.log.log(level, messages[i % 3].format(i, i % 64), extra={'app': paths[i % len(paths)]})
+        end = await settle(display)
+        results.add(f'log.ingest.rate.records={records}', records / (end - start), 'records/s', 'higher')
+        results.add(f'log.ingest.dropped.records={records}', display.ingest.dropped - dropped, 'records')
+
+    for history in config['search_history']:
+        display.delete_logs()
+        store = display.store
+        now = time.time()
+        for i in range(history):
+            level = logging.WARNING if i % 50 == 0 else logging.INFO
+            store.append(messages[i % 3].format(i, i % 64), now, level, rc.log.name, paths[i % len(paths)])
+        display.search.sync()
+        for name, query in SEARCHES.items():
+            query = query.format(root=rc.apps.root.name)
+
+            def search() -> None:
+                display.search.cache.clear() # every search starts cold, as when the user types a new query
+                display.search.filters.clear()
+                display.search.query, display.search.matches = '', []
+                logs.filter_logs(display, query)
+            results.add(f'log.search.{name}.history={history}', timed(search, config['search_repeat']))
+    display.delete_logs()
+
+
+def expand_all(rc) -> None:
+    stack = [rc.apps.root]
+    while stack:
+        node = stack.pop()
+        if node.pending is not None:
+            rc.apps.expand(node.path)
+        stack.extend(node.children)
+
+
+async def bench_tree(results:Results, app, rcs:list, config:dict) -> None:
+    '''Flattening the whole tree into rows, and rendering one screen of it, against the number of apps'''
+    import tui
+    display = app.query_one(tui.TreeDisplay)
+    for apps, rc in zip(config['tree_apps'], rcs):
+        app.show_partition(rc)
+        expand_all(rc)
+        await asyncio.sleep(0.1)
+        results.add(f'tree.rebuild.apps={apps}', timed(display.rebuild_rows, config['tree_repeat']))
+        height = display.size.height
+        results.add(f'tree.render_viewport.apps={apps}',
+                    timed(lambda: [display.render_line(y) for y in range(height)], config['tree_repeat']))
+
+
+async def bench_tui(results:Results, config:dict) -> None:
+    import tui
+    log_rc = quiet_rc(topology=synthetic_topology(1000), partition='logs')
+    tree_rcs = [quiet_rc(topology=synthetic_topology(apps), partition=f'tree{apps}') for apps in config['tree_apps']]
+    app = tui.app = tui.NanoRCTUI(log_rc, *tree_rcs)
+    async with app.run_test(headless=True, size=(160, 50)):
+        await asyncio.sleep(0.5)
+        await bench_logs(results, app, log_rc, config)
+        await bench_tree(results, app, tree_rcs, config)
+
+        app.show_partition(log_rc)
+        await asyncio.sleep(1)
+        wall, cpu = time.perf_counter(), time.process_time()
+        await asyncio.sleep(config['idle_seconds'])
+        results.add('idle.cpu', (time.process_time() - cpu) / (time.perf_counter() - wall), 'cores')
+
+
+async def run(quick:bool=False) -> dict:
+    config = QUICK if quick else FULL
+    results = Results()
+    await bench_transitions(results, config['transition_apps'], config['transition_repeat'])
+    await bench_tui(results, config)
+    return {
+        'meta': {'time': time.time(), 'python': platform.python_version(), 'machine': platform.platform(),
+                 'quick': quick},
+        'results': results.results,
+    }
+
+
+def compare(old:dict, new:dict, threshold:float=0.25) -> list[str]:
+    '''Prints how every result changed from old to new, returns the names of the ones that got worse by more than threshold'''
+    regressions = []
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if before is None:
+            continue
+        a, b = before['value'], result['value']
+        change = 0. if a == b else (b - a) / a if a else float('inf')
+        worse = change if result['better'] == 'lower' else -change
+        flag = 'REGRESSION' if worse > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f'{name:55} {a:12.6g} -> {b:12.6g} {result["unit"]:10} {change:+8.1%} {flag}')
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmarks the RC and the TUI, and compares benchmark results')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    run_parser = subparsers.add_parser('run', help='runs the benchmarks, results go to stdout as JSON')
+    run_parser.add_argument('-o', '--output', help='writes the results to this file instead')
+    run_parser.add_argument('--quick', action='store_true', help='smaller sizes and fewer repeats')
+    compare_parser = subparsers.add_parser('compare', help='exits with 1 if anything got worse than the threshold')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.25, help='relative change that counts (0.25 is 25%%)')
+    args = parser.parse_args()
+
+    if args.action == 'run':
+        report = asyncio.run(run(args.quick))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+            sys.exit(1)
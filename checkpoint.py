@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+
+from apptree import AppRegistry, Topology
+
+
+def topology_digest(topology:Topology) -> str:
+    '''Tells apart the configurations a checkpoint can be about'''
+    shape = [topology.names, list(topology.first_child), list(topology.child_count)]
+    return hashlib.sha256(json.dumps(shape, separators=(',', ':')).encode()).hexdigest()
+
+
+class StaleCheckpoint(Exception):
+    '''The checkpoint was made with another configuration of the apps'''
+
+
+class Checkpointer:
+    '''Keeps enough of an RC on disk to bring it back after its process died: its state, its run and its app tree.
+
+    Every change is appended to a journal as it happens, and the journal is
+    synced to disk whenever the RC reaches a stable state, i.e. once per
+    transition. Once the journal has snapshot_every entries, a compact
+    snapshot of everything replaces it, so that restoring never has more than
+    snapshot_every entries to replay on top of the snapshot. Entries are
+    numbered, so a journal that outlived its snapshot (a crash between the
+    two writes) is recognised and skipped. Both start with a digest of the
+    topology they were made with: a checkpoint about other apps than the
+    configured ones is discarded, and so is one that names apps that are not
+    in the tree any more.
+    '''
+    def __init__(self, rc, directory:str, snapshot_every:int=1000):
+        self.rc = rc
+        self.snapshot_every = snapshot_every
+        name = rc.partition or 'rc'
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_file = os.path.join(directory, f'{name}.snapshot')
+        self.journal_file = os.path.join(directory, f'{name}.journal')
+        self.journal = None
+        self.seq = 0     # number of the last entry written
+        self.entries = 0 # entries in the journal since the last snapshot
+        self.digest = topology_digest(rc.apps.topology)
+
+    def restore(self) -> bool:
+        '''Puts the RC back as it was last checkpointed, returns False if there was nothing (valid) to restore'''
+        rc = self.rc
+        fresh = rc.apps, rc._state, rc.runmgr.run_num, rc.runmgr.run_type
+        try:
+            return self.replay()
+        except (StaleCheckpoint, KeyError) as e:
+            rc.log.warning(f'Discarding the checkpoint in {os.path.dirname(self.journal_file)}: {e}')
+            rc.apps, rc._state, rc.runmgr.run_num, rc.runmgr.run_type = fresh
+            self.seq = self.entries = 0
+            self.discard()
+            return False
+
+    def replay(self) -> bool:
+        try:
+            with open(self.snapshot_file) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = None
+        if snapshot is not None and (snapshot.get('topology') != self.digest
+                                     or snapshot['tree']['topology'][0] != self.rc.apps.topology.names):
+            raise StaleCheckpoint('the snapshot was made with another configuration')
+        if snapshot is not None:
+            self.seq = snapshot['seq']
+            self.rc.apps = AppRegistry.from_snapshot(snapshot['tree'])
+            self.apply({'s': snapshot['state'], 'r': snapshot['run']})
+
+        restored = snapshot is not None
+        try:
+            with open(self.journal_file) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break # torn by the crash, everything after it is lost anyway
+                    if 'topology' in entry:
+                        if entry['topology'] != self.digest:
+                            raise StaleCheckpoint('the journal was made with another configuration')
+                        continue
+                    if entry['n'] <= self.seq:
+                        continue
+                    self.apply(entry)
+                    self.seq = entry['n']
+                    self.entries += 1
+                    restored = True
+        except OSError:
+            pass
+        return restored
+
+    def discard(self) -> None:
+        for filename in (self.snapshot_file, self.journal_file):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def apply(self, entry:dict) -> None:
+        rc = self.rc
+        if 't' in entry:
+            rc.apps.set_states(dict(entry['t']))
+        if 'r' in entry:
+            rc.runmgr.run_num, rc.runmgr.run_type = entry['r']
+        if 's' in entry:
+            rc._state = entry['s'] # no one is listening yet
+
+    def start(self) -> None:
+        '''Starts journaling the changes of the RC'''
+        self.journal = open(self.journal_file, 'a')
+        if self.journal.tell() == 0:
+            self.write_header()
+        self.rc.subscribe('state', self.on_state)
+        self.rc.subscribe('tree_delta', self.on_tree_delta)
+        self.rc.runmgr.subscribe('run', self.on_run)
+
+    def stop(self) -> None:
+        self.rc.unsubscribe('state', self.on_state)
+        self.rc.unsubscribe('tree_delta', self.on_tree_delta)
+        self.rc.runmgr.unsubscribe('run', self.on_run)
+        self.journal.close()
+
+    def write_header(self) -> None:
+        self.journal.write(json.dumps({'topology': self.digest}) + '\n')
+        self.journal.flush()
+
+    def write(self, entry:dict) -> None:
+        self.seq += 1
+        self.entries += 1
+        self.journal.write(json.dumps({'n': self.seq, **entry}, separators=(',', ':')) + '\n')
+        self.journal.flush()
+
+    def on_state(self, state:str) -> None:
+        self.write({'s': state})
+        if state.endswith('ing'):
+            return # only sync between transitions
+        if self.entries >= self.snapshot_every:
+            self.snapshot()
+        else:
+            os.fsync(self.journal.fileno())
+
+    def on_tree_delta(self, nodes:list) -> None:
+        states = [[node.path, node.state] for node in nodes if not node.children] # the rest follows from them
+        if states:
+            self.write({'t': states})
+
+    def on_run(self, run_num:int, run_type:str) -> None:
+        self.write({'r': [run_num, run_type]})
+
+    def snapshot(self) -> None:
+        '''Writes everything to a new snapshot and starts an empty journal'''
+        rc = self.rc
+        tmp_file = f'{self.snapshot_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'seq': self.seq,
+                'topology': self.digest,
+                'state': rc.state,
+                'run': [rc.runmgr.run_num, rc.runmgr.run_type],
+                'tree': rc.apps.snapshot(),
+            }, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        self.journal.close()
+        self.journal = open(self.journal_file, 'w')
+        self.write_header()
+        self.entries = 0
@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+
+class DispatchResult:
+    '''What happened to each app when a command was dispatched'''
+    def __init__(self, command:str):
+        self.command = command
+        self.succeeded = []  # type: list[str]
+        self.failed = {}     # type: dict[str, BaseException] app path -> what went wrong
+        self.stragglers = [] # type: list[str] apps that had not answered by the deadline (also in failed)
+        self.cancelled = []  # type: list[str] apps whose command was cancelled because another app failed
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def summary(self) -> str:
+        text = f'\'{self.command}\': {len(self.succeeded)} app(s) succeeded, {len(self.failed)} failed'
+        if self.stragglers:
+            text += f' ({len(self.stragglers)} timed out)'
+        if self.cancelled:
+            text += f', {len(self.cancelled)} cancelled'
+        stragglers = set(self.stragglers)
+        for path, error in self.failed.items():
+            if path not in stragglers:
+                text += f'\n  {path}: {error!r}'
+        if self.stragglers:
+            text += f'\n  no answer before the deadline from: {", ".join(self.stragglers)}'
+        return text
+
+
+class Progress:
+    '''How far a dispatch has got, passed to the progress callback'''
+    __slots__ = ('command', 'total', 'acknowledged', 'failed', 'start_time', 'finished')
+
+    def __init__(self, command:str, total:int):
+        self.command = command
+        self.total = total
+        self.acknowledged = 0 # apps that answered, successfully or not
+        self.failed = 0
+        self.start_time = time.monotonic()
+        self.finished = False # set once the dispatch is over, even if it stopped early
+
+    @property
+    def fraction(self) -> float:
+        return self.acknowledged / self.total if self.total else 1.
+
+    @property
+    def done(self) -> bool:
+        return self.acknowledged == self.total
+
+    @property
+    def eta(self) -> float:
+        '''Seconds left, assuming the remaining apps answer at the same rate as the previous ones'''
+        if not self.acknowledged:
+            return None
+        elapsed = time.monotonic() - self.start_time
+        return elapsed * (self.total - self.acknowledged) / self.acknowledged
+
+
+class Dispatcher:
+    '''Sends a command to many apps at once, with at most max_concurrency of them in flight.
+
+    The apps are given as a list of stages: every app in a stage gets the
+    command concurrently, and a stage only starts once the previous one is
+    done. As soon as an app fails, the rest of its stage is cancelled and the
+    next stages are not started, since they usually rely on it. If a deadline
+    is given, the apps that have not answered by then are reported as
+    stragglers and fail with a TimeoutError.
+    '''
+    def __init__(self, send, max_concurrency:int=64, progress_interval:float=0.05):
+        self.send = send # coroutine function (path, command, deadline=None, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.progress_interval = progress_interval # s, minimum time between two progress callbacks
+
+    async def dispatch(self, command:str, stages:list[list[str]], deadline:float=None, on_progress=None, **kwargs) -> DispatchResult:
+        '''deadline is in time.monotonic() seconds, it is also passed to every send.
+
+        on_progress(Progress) is called when starting, as apps answer (at most once per progress_interval) and at the end
+        '''
+        result = DispatchResult(command)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        progress = Progress(command, sum(len(stage) for stage in stages))
+        last_report = 0.
+
+        def report() -> None:
+            nonlocal last_report
+            now = time.monotonic()
+            if on_progress and now - last_report >= self.progress_interval:
+                last_report = now
+                on_progress(progress)
+
+        async def send_one(path:str) -> None:
+            async with semaphore:
+                try:
+                    await self.send(path, command, deadline=deadline, **kwargs)
+                except Exception as e:
+                    result.failed[path] = e
+                    progress.failed += 1
+                    progress.acknowledged += 1
+                    report()
+                    raise # wakes up the stage so that it can stop the others
+                result.succeeded.append(path)
+                progress.acknowledged += 1
+                report()
+
+        if on_progress:
+            on_progress(progress)
+
+        for stage in stages:
+            tasks = {asyncio.ensure_future(send_one(path)): path for path in stage}
+            timeout = None if deadline is None else max(0., deadline - time.monotonic())
+            pending = tasks.keys()
+            try:
+                _, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for task in pending:
+                    task.cancel() # nothing is left running behind our back, even when we are cancelled ourselves
+                if pending:
+                    await asyncio.wait(pending)
+                for task in tasks:
+                    if not task.cancelled():
+                        task.exception() # already in result.failed
+            timed_out = not result.failed # otherwise the stage was stopped by a failure
+            for task, path in tasks.items():
+                if task not in pending:
+                    continue
+                if timed_out:
+                    result.stragglers.append(path)
+                    result.failed[path] = TimeoutError(f'No answer from {path} before the deadline')
+                else:
+                    result.cancelled.append(path)
+            if result.failed:
+                break
+        progress.finished = True
+        if on_progress:
+            on_progress(progress)
+        return result
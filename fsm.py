@@ -0,0 +1,57 @@
+# The state machine: command -> (state it can be sent from, state it leads to)
+TRANSITIONS = {
+    'boot':                 ('none',                    'initialised'            ),
+    'conf':                 ('initialised',             'configured'             ),
+    'start':                ('configured',              'ready'                  ),
+    'enable_trigger':       ('ready',                   'trigger_enabled'        ),
+    'disable_trigger':      ('trigger_enabled',         'ready'                  ),
+    'drain_dataflow':       ('ready',                   'dataflow_drained'       ),
+    'stop_trigger_sources': ('dataflow_drained',        'trigger_sources_stopped'),
+    'stop':                 ('trigger_sources_stopped', 'configured'             ),
+    'scrap':                ('configured',              'initialised'            ),
+    'terminate':            ('initialised',             'none'                   ),
+} # type: dict[str, tuple[str, str]]
+
+# Commands made of a path of transitions: command -> (state to reach, states it can be sent from)
+COMPOSITES = {
+    'start_run': ('trigger_enabled', ['initialised', 'configured']),
+    'shutdown':  ('none',            ['initialised', 'configured', 'ready', 'trigger_enabled',
+                                      'dataflow_drained', 'trigger_sources_stopped']),
+} # type: dict[str, tuple[str, list[str]]]
+
+def plan_transitions(from_state:str, to_state:str) -> list[str]:
+    '''The shortest list of commands that goes from from_state to to_state, None if there is none'''
+    previous = {from_state: None} # state -> (command, state before), as found by a breadth first search
+    frontier = [from_state]
+    while frontier and to_state not in previous:
+        next_frontier = []
+        for state in frontier:
+            for command in COMMANDS_FROM.get(state, []):
+                out_state = TRANSITIONS[command][1]
+                if out_state not in previous:
+                    previous[out_state] = (command, state)
+                    next_frontier.append(out_state)
+        frontier = next_frontier
+    if to_state not in previous:
+        return None
+    path = []
+    state = to_state
+    while previous[state] is not None:
+        command, state = previous[state]
+        path.append(command)
+    return path[::-1]
+
+COMMANDS_FROM = {} # type: dict[str, list[str]]
+for _command, (_in_state, _out_state) in TRANSITIONS.items():
+    COMMANDS_FROM.setdefault(_in_state, []).append(_command)
+
+AVAILABLE_COMMANDS = {state: list(commands) for state, commands in COMMANDS_FROM.items()} # type: dict[str, list[str]]
+for _command, (_target, _from_states) in COMPOSITES.items():
+    for _state in _from_states:
+        AVAILABLE_COMMANDS.setdefault(_state, []).append(_command)
+
+PLANS = {
+    (state, target): plan_transitions(state, target)
+    for target, from_states in COMPOSITES.values()
+    for state in from_states
+} # type: dict[tuple[str, str], list[str]]
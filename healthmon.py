@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+import time
+
+from appendpoint import read_http
+
+
+class ConnectionPool:
+    '''Up to size persistent HTTP/1.1 connections to one host, reused from one request to the next'''
+    def __init__(self, host:str, port:int, size:int=8, timeout:float=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout # s, for connecting and for each request
+        self.idle = []         # type: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]
+        self.slots = asyncio.Semaphore(size)
+        self.opened = 0        # connections opened so far, ideally no more than size
+
+    async def post(self, target:str, payload):
+        '''Sends payload as JSON, returns the decoded reply'''
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        request = (f'POST {target} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n'
+                   f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+        async with self.slots:
+            reused = bool(self.idle)
+            try:
+                return await self.exchange(request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                return await self.exchange(request) # the server may have closed an idle connection, once is not a failure
+
+    async def exchange(self, request:bytes):
+        if self.idle:
+            reader, writer = self.idle.pop()
+        else:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            self.opened += 1
+        try:
+            writer.write(request)
+            message = await asyncio.wait_for(read_http(reader), self.timeout)
+            if message is None:
+                raise ConnectionError('Connection closed by the app endpoint')
+            first, _, data = message
+            status = first.split(' ', 2)[1]
+            if status != '200':
+                raise ConnectionError(f'App endpoint answered {first}')
+        except BaseException:
+            writer.close()
+            raise
+        self.idle.append((reader, writer))
+        return json.loads(data)
+
+    def close(self) -> None:
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class HealthMonitor:
+    '''Polls all the apps of an RC in the background, and writes what changed into its tree.
+
+    Apps are polled in batches of batch_size paths per request, all batches
+    at once over a few pooled connections per endpoint, every interval
+    seconds give or take jitter (a fraction of it), so that many monitors do
+    not poll in lockstep. An app that does not answer goes to UNRESPONSIVE,
+    and is then polled less and less often, up to max_backoff seconds apart,
+    until it answers again. An app that answers with a state gets that state;
+    one that answers without (the endpoint does not know) gets back the state
+    it had before it stopped answering. Only the apps that changed are written
+    to the tree, so a healthy system costs no update at all.
+    '''
+    UNRESPONSIVE = 'unresponsive'
+
+    def __init__(self, rc, endpoint, interval:float=1.0, batch_size:int=500, connections:int=8,
+                 jitter:float=0.1, max_backoff:float=30, timeout:float=2.0):
+        self.rc = rc
+        self.endpoint = endpoint # 'host:port' for all the apps, or a function from an app path to its 'host:port'
+        self.interval = interval # s
+        self.batch_size = batch_size
+        self.connections = connections # per endpoint
+        self.jitter = jitter
+        self.max_backoff = max_backoff # s
+        self.timeout = timeout # s
+        self.pools = {}        # type: dict[str, ConnectionPool]
+        self.failures = {}     # type: dict[str, int] app path -> polls it did not answer in a row
+        self.next_poll = {}    # type: dict[str, float] app path -> when to poll it again, for the ones backing off
+        self.lost = {}         # type: dict[str, str] app path -> its state before it stopped answering
+        self.cycles = 0
+        self.last_cycle = 0.   # s spent in the last cycle
+        self.task = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        for pool in self.pools.values():
+            pool.close()
+
+    def pool(self, address:str) -> ConnectionPool:
+        if address not in self.pools:
+            host, _, port = address.rpartition(':')
+            self.pools[address] = ConnectionPool(host or '127.0.0.1', int(port), self.connections, self.timeout)
+        return self.pools[address]
+
+    async def run(self) -> None:
+        while True:
+            start = time.monotonic()
+            await self.poll()
+            self.last_cycle = time.monotonic() - start
+            period = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            await asyncio.sleep(max(0., period - self.last_cycle))
+
+    async def poll_batch(self, address:str, paths:list[str]) -> dict:
+        try:
+            return await self.pool(address).post('/status', paths)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            return {} # nobody answered
+
+    async def poll(self) -> None:
+        '''Polls all the apps that are due once'''
+        now = time.monotonic()
+        next_poll = self.next_poll
+        groups = {} # type: dict[str, list[str]] endpoint -> paths
+        for path in self.rc.apps.app_paths():
+            if next_poll and next_poll.get(path, 0) > now:
+                continue
+            address = self.endpoint if isinstance(self.endpoint, str) else self.endpoint(path)
+            groups.setdefault(address, []).append(path)
+        batches = [
+            (address, paths[i:i + self.batch_size])
+            for address, paths in groups.items()
+            for i in range(0, len(paths), self.batch_size)
+        ]
+        replies = await asyncio.gather(*[self.poll_batch(address, paths) for address, paths in batches])
+
+        apps = self.rc.apps
+        changes = {}
+        for (_, paths), reply in zip(batches, replies):
+            for path in paths:
+                answer = reply.get(path)
+                current = apps.state_of(path)
+                if answer is None:
+                    failures = self.failures[path] = self.failures.get(path, 0) + 1
+                    backoff = min(self.interval * 2 ** failures, self.max_backoff)
+                    next_poll[path] = now + backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+                    if current != self.UNRESPONSIVE:
+                        self.lost[path] = current
+                        changes[path] = self.UNRESPONSIVE
+                    continue
+                if path in self.failures:
+                    del self.failures[path]
+                    del next_poll[path]
+                previous = self.lost.pop(path, None)
+                state = answer.get('state')
+                if state is None and current == self.UNRESPONSIVE:
+                    state = previous
+                if state is not None and state != current:
+                    changes[path] = state
+        if changes:
+            self.rc.update_apps(changes)
+        self.cycles += 1
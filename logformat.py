@@ -0,0 +1,56 @@
+import threading
+from collections import deque
+
+from rich.logging import RichHandler
+
+
+class LogFormatter:
+    '''Drains and formats log records on a background thread.
+
+    The expensive part (rich markup and highlighting in RichHandler) happens
+    here, and the finished messages are handed over in batches through a
+    deque, already split into lines with the rich spans of each, so the UI
+    only has to append them and style the few lines on screen. When the UI falls behind by
+    more than max_ready batches, the thread stops draining: the records then
+    pile up in the log queue, where LogIngest's overload policy deals with them.
+    '''
+    def __init__(self, ingest, max_ready:int=200, wait:float=0.1):
+        self.ingest = ingest
+        self.handler = RichHandler()
+        self.ready = deque() # batches of formatted messages, appended here and popped by the UI
+        self.max_ready = max_ready
+        self.wait = wait     # s, how long the thread blocks on an empty queue before checking if it should stop
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name='log-formatter', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def format(self, record) -> tuple:
+        '''The formatted message, with the fields LogStore keeps next to it and the spans of its lines'''
+        text = self.handler.render_message(record, record.getMessage())
+        lines = text.split('\n', allow_blank=True)
+        styles = [line.spans or None for line in lines] if text.spans else None
+        return (text.plain, record.created, record.levelno, record.name, getattr(record, 'app', None), styles)
+
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            if len(self.ready) >= self.max_ready:
+                self.stopping.wait(self.wait)
+                continue
+            batch = self.ingest.drain(wait=self.wait)
+            if batch:
+                self.ready.append([self.format(record) for record in batch])
+
+    def take(self, max_messages:int) -> list[tuple]:
+        '''Up to (about) max_messages (text, created, level, logger, app, styles) tuples, oldest first'''
+        messages = []
+        while self.ready and len(messages) < max_messages:
+            messages.extend(self.ready.popleft())
+        return messages
@@ -0,0 +1,76 @@
+import logging
+import queue
+
+
+class LogIngest:
+    '''Takes log records off a queue in bounded batches, so that a burst never freezes the UI.
+
+    Consecutive copies of the same message (from the same logger and app) are
+    collapsed into one record and a "repeated N times" note. When the queue is
+    deeper than overload_depth, the records below WARNING are shed following
+    the policy:
+      - 'sample': only one in every sample_rate of them is kept
+      - 'drop':   all of them are dropped
+    Everything that is shed is counted in dropped.
+    '''
+    POLICIES = ('sample', 'drop')
+
+    def __init__(self, log_queue, batch_size:int=500, max_examined:int=20000,
+                 overload_depth:int=10000, policy:str='sample', sample_rate:int=10):
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown overload policy \'{policy}\', expected one of {self.POLICIES}')
+        self.log_queue = log_queue
+        self.batch_size = batch_size       # records returned per drain at most
+        self.max_examined = max_examined   # records taken off the queue per drain at most, shed ones included
+        self.overload_depth = overload_depth
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.sampled = 0
+        self.last_record = None
+        self.last_key = None
+        self.repeats = 0
+
+    def shed(self, record:logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return False
+        if self.policy == 'sample':
+            self.sampled += 1
+            if self.sampled % self.sample_rate == 0:
+                return False
+        self.dropped += 1
+        return True
+
+    def repeat_note(self) -> logging.LogRecord:
+        record = logging.makeLogRecord(self.last_record.__dict__)
+        record.msg = f'Previous message repeated {self.repeats} times'
+        record.args = None
+        self.repeats = 0
+        return record
+
+    def drain(self, wait:float=0) -> list[logging.LogRecord]:
+        '''Returns the next batch, waiting up to wait seconds for the first record if the queue is empty'''
+        batch = []
+        overloaded = self.log_queue.qsize() > self.overload_depth
+        for i in range(self.max_examined):
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                record = self.log_queue.get(block=(wait > 0 and i == 0), timeout=wait or None)
+            except queue.Empty:
+                break
+            if overloaded and self.shed(record):
+                continue
+            key = (record.name, record.levelno, getattr(record, 'app', None), record.getMessage())
+            if key == self.last_key:
+                self.repeats += 1
+                continue
+            if self.repeats:
+                batch.append(self.repeat_note())
+            self.last_record = record
+            self.last_key = key
+            batch.append(record)
+
+        if self.repeats:
+            batch.append(self.repeat_note())
+        return batch
@@ -0,0 +1,279 @@
+import heapq
+import itertools
+import logging
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+
+def merge_postings(postings:list, lo:int, hi:int) -> list[int]:
+    '''The seqs in [lo, hi) of all of postings, sorted. Merging thousands of them (all the apps of a partition)
+    through a heap costs much more than sorting them all at once.'''
+    seqs = [p.between(lo, hi) for p in postings]
+    if len(seqs) <= 16:
+        return list(heapq.merge(*seqs))
+    return sorted(itertools.chain.from_iterable(seqs))
+
+
+class LogBlock:
+    '''A sealed run of consecutive lines, lowercased once and joined into a single string.
+
+    Searching a block is one str.find per hit instead of one Python-level
+    comparison per line.
+    '''
+    __slots__ = ('first_seq', 'text', 'offsets')
+
+    def __init__(self, first_seq:int, lines:list[str]):
+        self.first_seq = first_seq
+        self.text = '\n'.join(lines) + '\n'
+        self.offsets = array('L', [0])  # offsets[i] is where line i starts, offsets[-1] is len(text)
+        pos = 0
+        for line in lines:
+            pos += len(line) + 1
+            self.offsets.append(pos)
+
+    @property
+    def end_seq(self) -> int:
+        return self.first_seq + len(self.offsets) - 1
+
+    def line(self, seq:int) -> str:
+        i = seq - self.first_seq
+        return self.text[self.offsets[i]:self.offsets[i+1]-1]
+
+    def find(self, term:str, start_seq:int) -> list[int]:
+        skip = max(start_seq - self.first_seq, 0)
+        pos = self.text.find(term, self.offsets[skip])
+        if pos < 0:
+            return []
+        if self.text.count(term, pos) * 8 > len(self.offsets) - skip:
+            # Dense hits: one bisect per hit costs more than checking every line
+            lines = self.text[self.offsets[skip]:-1].split('\n')
+            first = self.first_seq + skip
+            return [first + i for i, line in enumerate(lines) if term in line]
+        found = []
+        while True:
+            pos = self.text.find(term, pos)
+            if pos < 0:
+                return found
+            i = bisect_right(self.offsets, pos) - 1
+            found.append(self.first_seq + i)
+            pos = self.offsets[i+1]  # one hit per line is enough, skip to the next one
+
+
+class LogQuery:
+    '''What the user typed in the search box: free text, plus optional filters on the structured fields.
+
+    Filters are written as key:value and can appear anywhere in the query:
+      level:warning  lines at WARNING or above
+      logger:RC      lines from that logger
+      app:np04_coldbox/daq  lines tagged with that app or any app below it
+      since:5m       lines from the last 5 minutes (s, m, h or d)
+    '''
+    __slots__ = ('text', 'min_level', 'logger', 'app', 'since')
+    FILTER = re.compile(r'(?:^|\s)(level|logger|app|since):(\S+)')
+    UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+    def __init__(self, text:str='', min_level:int=None, logger:str=None, app:str=None, since:float=None):
+        self.text = text
+        self.min_level = min_level
+        self.logger = logger
+        self.app = app
+        self.since = since # absolute time
+
+    @classmethod
+    def parse(cls, query:str, now:float=None) -> 'LogQuery':
+        q = cls()
+        for key, value in cls.FILTER.findall(query):
+            if key == 'level':
+                level = logging.getLevelName(value.upper())
+                q.min_level = level if isinstance(level, int) else int(value) if value.isdigit() else None
+            elif key == 'since':
+                amount, unit = value[:-1], value[-1]
+                if unit.isdigit():
+                    amount, unit = value, 's'
+                try:
+                    q.since = (now or time.time()) - float(amount) * cls.UNITS[unit]
+                except (ValueError, KeyError):
+                    pass
+            else:
+                setattr(q, key, value)
+        q.text = cls.FILTER.sub('', query).strip()
+        return q
+
+    def structured(self) -> bool:
+        return self.min_level is not None or self.logger is not None or self.app is not None or self.since is not None
+
+
+class LogSearch:
+    '''Incremental, case insensitive substring search over a LogStore.
+
+    Every line is lowercased exactly once, when it is indexed. The result of
+    the current query is kept and only extended with the lines appended since
+    the last call, and a query that extends a previous one only re-checks that
+    query's matches when there are few enough of them. A few recent results are
+    cached so that deleting characters from the query is cheap too. Structured
+    queries are cached the same way, and only the new lines are checked
+    against their filters.
+    '''
+    def __init__(self, store, block_size:int=4096, cache_size:int=16):
+        self.store = store
+        self.block_size = block_size
+        self.blocks = []           # sealed LogBlocks, oldest first
+        self.open_first_seq = store.first_seq
+        self.open_lines = []       # lowercased lines not sealed in a block yet
+        self.cache = OrderedDict() # query -> (matches, seq up to which matches are complete)
+        self.filters = OrderedDict() # structured query -> (matches, seq up to which they are complete, app ids, app names interned then)
+        self.cache_size = cache_size
+        self.query = ''
+        self.matches = []
+
+    @property
+    def indexed_seq(self) -> int:
+        return self.open_first_seq + len(self.open_lines)
+
+    def run(self, query:str) -> list[int]:
+        '''Runs what the user typed in the search box, returns the matching seqs oldest first'''
+        q = LogQuery.parse(query)
+        if not q.structured():
+            return self.search(q.text)
+        return self.filter(q, query)
+
+    def filter(self, q:LogQuery, key:str=None) -> list[int]:
+        '''The seqs of the held lines passing q, oldest first. Under key, the result is cached with the seq up to
+        which it is complete (and the app ids of q.app), so that running it again only checks the new lines.'''
+        store = self.store
+        lo = store.seq_at_time(q.since) if q.since is not None else store.first_seq
+        cached = self.filters.pop(key, None) if key is not None else None
+        if cached is None:
+            app_ids = store.app_subtree_ids(q.app) if q.app is not None else None
+            matches = self.filter_all(q, lo, app_ids)
+        else:
+            matches, upto, app_ids, interned = cached
+            if app_ids is not None and interned < len(store.app_names):
+                app_ids |= store.app_subtree_ids(q.app, interned)
+            if matches and matches[0] < lo:
+                matches = matches[bisect_left(matches, lo):]
+            if q.text:
+                self.sync()
+            matches.extend(self.check(q, store.since(max(upto, lo)), app_ids))
+
+        if key is not None:
+            self.filters[key] = (matches, store.next_seq, app_ids, len(store.app_names))
+            while len(self.filters) > self.cache_size:
+                self.filters.popitem(last=False)
+        return matches
+
+    def filter_all(self, q:LogQuery, lo:int, app_ids:set[int]) -> list[int]:
+        '''Starts from the smallest index that applies, then checks the other fields line by line'''
+        store = self.store
+        hi = store.next_seq
+
+        sources = [] # (number of candidates, how to get them)
+        if q.min_level is not None:
+            level_postings = store.level_postings_from(q.min_level)
+            sources.append((
+                sum(p.count_between(lo, hi) for p in level_postings),
+                lambda: merge_postings(level_postings, lo, hi)
+            ))
+        logger_id = store.logger_ids.get(q.logger, -1) if q.logger is not None else None
+        if logger_id is not None:
+            logger = store.postings(store.logger_postings, logger_id)
+            sources.append((logger.count_between(lo, hi), lambda: logger.between(lo, hi)))
+        if app_ids is not None:
+            app_postings = [store.postings(store.app_postings, app_id) for app_id in app_ids]
+            sources.append((
+                sum(p.count_between(lo, hi) for p in app_postings),
+                lambda: merge_postings(app_postings, lo, hi)
+            ))
+            # The per-app views are bounded, an app filter always starts from them so that it never goes further back
+            sources = sources[-1:]
+
+        count, candidates = min(sources, key=lambda source: source[0], default=(hi - lo, lambda: range(lo, hi)))
+        if q.text and app_ids is None and count * 16 > len(store):
+            # Not selective enough, let the text index do the heavy lifting
+            matches = self.search(q.text)
+            return self.check(q, matches[bisect_left(matches, lo):], app_ids, text=False)
+        if q.text:
+            self.sync()
+        return self.check(q, candidates(), app_ids)
+
+    def check(self, q:LogQuery, seqs, app_ids:set[int], text:bool=True) -> list[int]:
+        '''The ones of seqs that pass the filters of q, and its text if text is set'''
+        store = self.store
+        logger_id = store.logger_ids.get(q.logger, -1) if q.logger is not None else None
+        term = q.text.lower() if text else ''
+        capacity = store.capacity
+        levels, loggers, apps = store.levels, store.loggers, store.apps
+        return [
+            seq for seq in seqs
+            if (q.min_level is None or levels[seq % capacity] >= q.min_level)
+            and (logger_id is None or loggers[seq % capacity] == logger_id)
+            and (app_ids is None or apps[seq % capacity] in app_ids)
+            and (not term or term in self.lower(seq))
+        ]
+
+    def sync(self) -> None:
+        '''Indexes the lines appended to the store since the last call and forgets evicted ones'''
+        store = self.store
+        while self.blocks and self.blocks[0].end_seq <= store.first_seq:
+            del self.blocks[0]
+        if not self.blocks and store.first_seq > self.open_first_seq:
+            self.open_lines = self.open_lines[store.first_seq - self.open_first_seq:]
+            self.open_first_seq = store.first_seq
+
+        for seq in store.since(self.indexed_seq):
+            self.open_lines.append(store.get(seq).lower())
+            if len(self.open_lines) == self.block_size:
+                self.blocks.append(LogBlock(self.open_first_seq, self.open_lines))
+                self.open_first_seq += self.block_size
+                self.open_lines = []
+
+    def lower(self, seq:int) -> str:
+        if seq >= self.open_first_seq:
+            return self.open_lines[seq - self.open_first_seq]
+        # Blocks are contiguous and all block_size long, so no search is needed
+        block = self.blocks[(seq - self.blocks[0].first_seq) // self.block_size]
+        return block.line(seq)
+
+    def scan(self, term:str, start_seq:int) -> list[int]:
+        '''All the indexed lines from start_seq onwards that contain term'''
+        found = []
+        first = max((start_seq - self.blocks[0].first_seq) // self.block_size, 0) if self.blocks else 0
+        for block in self.blocks[first:]:
+            if block.end_seq > start_seq:
+                found.extend(block.find(term, start_seq))
+        first_open = max(start_seq, self.open_first_seq)
+        for i in range(first_open - self.open_first_seq, len(self.open_lines)):
+            if term in self.open_lines[i]:
+                found.append(self.open_first_seq + i)
+        return found
+
+    def search(self, query:str) -> list[int]:
+        '''Returns the seqs of the held lines matching query, oldest first'''
+        self.sync()
+        term = query.lower()
+        first_seq = self.store.first_seq
+
+        if term in self.cache:
+            matches, upto = self.cache.pop(term)
+        else:
+            base = max((q for q in self.cache if q in term), key=len, default=None)
+            if base is not None and len(self.cache[base][0]) * 16 < self.indexed_seq - first_seq:
+                matches, upto = self.cache[base]
+                matches = [seq for seq in matches if seq >= first_seq and term in self.lower(seq)]
+            else:
+                matches, upto = [], first_seq
+
+        if matches and matches[0] < first_seq:
+            matches = matches[bisect_right(matches, first_seq - 1):]
+        if upto < self.indexed_seq:
+            matches.extend(self.scan(term, max(upto, first_seq)))
+
+        self.cache[term] = (matches, self.indexed_seq)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.query = query
+        self.matches = matches
+        return matches
@@ -0,0 +1,126 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+
+class LogSink(logging.Handler):
+    '''A logging handler that streams every record to disk from a background thread.
+
+    Records are written as JSON lines, in batches. The current file is rotated
+    when it gets bigger than max_bytes or older than max_age seconds, and the
+    rotated files are gzipped if compress is set. emit() only puts the record
+    on a queue, so the thread that logs never waits for the disk.
+    '''
+    def __init__(self, directory:str='logs', prefix:str='rc', max_bytes:int=64*1024*1024, max_age:float=3600,
+                 compress:bool=True, batch_size:int=1000, level=logging.NOTSET):
+        super().__init__(level)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age   # s
+        self.compress = compress
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.filename = None
+        self.lock = threading.Lock() # guards filename, which mark() reads from other threads
+        self.write_errors = 0
+        self.opened = 0.
+        self.written = 0
+        self.files = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='log-sink', daemon=True)
+        self.thread.start()
+
+    def emit(self, record:logging.LogRecord) -> None:
+        try:
+            self.queue.put({
+                'time': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'app': getattr(record, 'app', None),
+                'message': record.getMessage(),
+            })
+        except Exception:
+            self.handleError(record)
+
+    def mark(self, note:str) -> str:
+        '''Writes a marker in the stream and closes the current file right after it, returns that file's name
+
+        This is what "Save logs" does: everything logged until now ends up in the
+        returned file (or in the ones before it), nothing is copied.
+        '''
+        with self.lock:
+            if self.filename is None:
+                self.filename = self.new_filename()
+            filename = self.filename
+        self.queue.put({'time': time.time(), 'level': 'MARK', 'logger': None, 'app': None, 'message': note})
+        self.queue.put(None) # asks the thread to rotate once it has written the marker
+        return f'{filename}.gz' if self.compress else filename
+
+    def close(self) -> None:
+        self.stopping.set()
+        self.thread.join()
+        super().close()
+
+    def new_filename(self) -> str:
+        time_str = datetime.now().strftime('%Y-%m-%d-%H%M%S')
+        self.files += 1
+        return os.path.join(self.directory, f'{self.prefix}_{time_str}_{os.getpid()}_{self.files}.jsonl')
+
+    def open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            self.filename = self.filename or self.new_filename()
+        self.file = open(self.filename, 'a')
+        self.opened = time.monotonic()
+        self.written = 0
+
+    def rotate(self) -> None:
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if self.compress:
+            with open(self.filename, 'rb') as f_in, gzip.open(f'{self.filename}.gz', 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(self.filename)
+        with self.lock:
+            self.filename = None
+
+    def write(self, entries:list) -> None:
+        if self.file is None:
+            self.open()
+        data = ''.join(json.dumps(entry) + '\n' for entry in entries)
+        self.file.write(data)
+        self.file.flush()
+        self.written += len(data)
+
+    def run(self) -> None:
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = []
+            rotate = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self.queue.get_nowait() if batch else self.queue.get(timeout=0.2)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    rotate = True
+                    break
+                batch.append(entry)
+            try:
+                if batch:
+                    self.write(batch)
+                if rotate or (self.file is not None and (
+                        self.written >= self.max_bytes or time.monotonic() - self.opened >= self.max_age)):
+                    self.rotate()
+            except OSError:
+                self.write_errors += 1 # losing logs must not take the controller down with it
+        self.rotate()
@@ -0,0 +1,208 @@
+import logging
+import time
+from array import array
+from bisect import bisect_left
+
+
+class Postings:
+    '''The sorted seqs of the lines that have some property, e.g. a given level.
+
+    Evicted seqs are trimmed lazily from the front, the list is only compacted
+    once the dead part is as big as the live one.
+    '''
+    __slots__ = ('seqs', 'start')
+
+    def __init__(self):
+        self.seqs = array('q')
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.start
+
+    def append(self, seq:int) -> None:
+        self.seqs.append(seq)
+
+    def trim(self, first_seq:int, limit:int=None) -> None:
+        '''Forgets the seqs before first_seq, and all but the last limit ones if limit is given'''
+        self.start = bisect_left(self.seqs, first_seq, self.start)
+        if limit is not None:
+            self.start = max(self.start, len(self.seqs) - limit)
+        if self.start > len(self.seqs) // 2:
+            del self.seqs[:self.start]
+            self.start = 0
+
+    def between(self, lo:int, hi:int) -> list[int]:
+        '''The seqs in [lo, hi)'''
+        return self.seqs[bisect_left(self.seqs, lo, self.start):bisect_left(self.seqs, hi, self.start)].tolist()
+
+    def count_between(self, lo:int, hi:int) -> int:
+        return bisect_left(self.seqs, hi, self.start) - bisect_left(self.seqs, lo, self.start)
+
+
+class LogStore:
+    '''A capacity-bounded, append-only store of log lines.
+
+    Lines are kept in a ring buffer and addressed by a monotonically increasing
+    sequence number, so readers can ask for "everything after seq N" without
+    caring about what has been evicted in between.
+
+    Next to the text, every line keeps the structured fields of the record it
+    came from in parallel arrays: time, level, logger and app (the last two
+    interned as small ints). Levels, loggers and apps also have Postings, so
+    that filtering on them never has to look at the other lines. Lines without
+    an app are not indexed by app, and each app only indexes its last
+    app_view_size lines, so that a chatty app cannot take all the memory. Times are stored as a running maximum,
+    which keeps them sorted for bisection even when records from different
+    threads arrive slightly out of order.
+    '''
+    EVICTION_POLICIES = ('oldest', 'newest')
+
+    def __init__(self, capacity:int=100000, eviction:str='oldest', app_view_size:int=10000):
+        if capacity <= 0:
+            raise ValueError(f'LogStore capacity must be positive, got {capacity}')
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy \'{eviction}\', expected one of {self.EVICTION_POLICIES}')
+        self.capacity = capacity
+        self.eviction = eviction   # 'oldest': overwrite the oldest line, 'newest': refuse new lines when full
+        self.lines = [None] * capacity
+        self.styles = [None] * capacity # the rich spans of each line, None if it is plain
+        self.times = array('d', bytes(8 * capacity))
+        self.levels = array('B', bytes(capacity))
+        self.loggers = array('H', bytes(2 * capacity))
+        self.apps = array('L', bytes(array('L').itemsize * capacity))
+        self.logger_names = ['']   # id -> name, 0 is "no logger"
+        self.logger_ids = {'': 0}
+        self.app_names = ['']      # id -> app path, 0 is "no app"
+        self.app_ids = {'': 0}
+        self.level_postings = {}   # type: dict[int, Postings]
+        self.logger_postings = {}  # type: dict[int, Postings]
+        self.app_postings = {}     # type: dict[int, Postings]
+        self.app_view_size = app_view_size # lines kept in each app's postings at most
+        self.first_seq = 0         # seq of the oldest line still held
+        self.next_seq = 0          # seq the next appended line will get
+        self.last_time = 0.
+        self.untrimmed = 0         # lines evicted since the postings were last trimmed
+        self.rejected = 0          # lines refused by the 'newest' policy
+        self.max_width = 0
+
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+
+    def __contains__(self, seq:int) -> bool:
+        return self.first_seq <= seq < self.next_seq
+
+    def get(self, seq:int) -> str:
+        if seq not in self:
+            raise IndexError(f'Log line {seq} is not in the store')
+        return self.lines[seq % self.capacity]
+
+    def style(self, seq:int) -> list:
+        '''The rich spans of line seq, None if it is plain'''
+        return self.styles[seq % self.capacity]
+
+    def intern_logger(self, name:str) -> int:
+        if name not in self.logger_ids:
+            self.logger_ids[name] = len(self.logger_names)
+            self.logger_names.append(name)
+        return self.logger_ids[name]
+
+    def intern_app(self, path:str) -> int:
+        if path not in self.app_ids:
+            self.app_ids[path] = len(self.app_names)
+            self.app_names.append(path)
+        return self.app_ids[path]
+
+    def append(self, text:str, created:float=None, level:int=logging.INFO, logger:str='', app:str=None,
+               styles:list=None) -> int:
+        '''Appends a (possibly multi-line) message, with the rich spans of each of its lines if it has any,
+        returns the number of lines stored'''
+        self.last_time = max(self.last_time, created or time.time())
+        logger_id = self.intern_logger(logger or '')
+        app_id = self.intern_app(app or '')
+        level_postings = self.level_postings.setdefault(level, Postings())
+        logger_postings = self.logger_postings.setdefault(logger_id, Postings())
+        app_postings = self.app_postings.setdefault(app_id, Postings()) if app_id else None
+        stored = 0
+        for n, line in enumerate(text.split('\n')):
+            if self.next_seq - self.first_seq == self.capacity:
+                if self.eviction == 'newest':
+                    self.rejected += 1
+                    continue
+                self.first_seq += 1
+                self.untrimmed += 1
+            seq = self.next_seq
+            i = seq % self.capacity
+            self.lines[i] = line
+            self.styles[i] = styles[n] if styles else None
+            self.times[i] = self.last_time
+            self.levels[i] = level
+            self.loggers[i] = logger_id
+            self.apps[i] = app_id
+            level_postings.append(seq)
+            logger_postings.append(seq)
+            if app_postings is not None:
+                app_postings.append(seq)
+                if len(app_postings.seqs) >= 2 * self.app_view_size:
+                    app_postings.trim(self.first_seq, self.app_view_size)
+            self.next_seq += 1
+            self.max_width = max(self.max_width, len(line))
+            stored += 1
+        if self.untrimmed > self.capacity // 2:
+            self.trim()
+        return stored
+
+    def trim(self) -> None:
+        '''Drops the evicted seqs from all the postings, so they stay bounded even if nobody filters'''
+        for index in (self.level_postings, self.logger_postings, self.app_postings):
+            for postings in index.values():
+                postings.trim(self.first_seq)
+        self.untrimmed = 0
+
+    def since(self, seq:int) -> range:
+        '''The seqs of all the lines appended after seq that are still held'''
+        return range(max(seq, self.first_seq), self.next_seq)
+
+    def time(self, seq:int) -> float:
+        return self.times[seq % self.capacity]
+
+    def level(self, seq:int) -> int:
+        return self.levels[seq % self.capacity]
+
+    def logger(self, seq:int) -> str:
+        return self.logger_names[self.loggers[seq % self.capacity]]
+
+    def app(self, seq:int) -> str:
+        return self.app_names[self.apps[seq % self.capacity]]
+
+    def seq_at_time(self, t:float) -> int:
+        '''The first held seq logged at or after t'''
+        lo, hi = self.first_seq, self.next_seq
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[mid % self.capacity] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def postings(self, index:dict, key:int) -> Postings:
+        postings = index.get(key)
+        if postings is None:
+            return Postings()
+        postings.trim(self.first_seq)
+        return postings
+
+    def app_subtree_ids(self, path:str, start:int=0) -> set[int]:
+        '''The ids of the app at path and of all the apps below it, among the ones interned from id start on'''
+        prefix = path + '/'
+        return {i for i, name in enumerate(self.app_names[start:], start) if name == path or name.startswith(prefix)}
+
+    def level_postings_from(self, min_level:int) -> list[Postings]:
+        return [self.postings(self.level_postings, level) for level in self.level_postings if level >= min_level]
+
+    def clear(self) -> None:
+        self.lines = [None] * self.capacity
+        self.styles = [None] * self.capacity
+        self.first_seq = self.next_seq
+        self.max_width = 0
+        self.trim() # everything is evicted at once, the ring may never wrap to trim it
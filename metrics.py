@@ -0,0 +1,277 @@
+import asyncio
+import functools
+import os
+import time
+from bisect import bisect_left
+
+from appendpoint import read_http
+from rcserver import parse_address
+
+# s, from a tenth of a millisecond (one app, one widget refresh) to a minute (a whole transition)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+
+
+class Registry:
+    '''All the metrics of the process, rendered in the Prometheus text format only when someone asks'''
+    def __init__(self):
+        self.metrics = [] # type: list[Metric]
+
+    def register(self, metric:'Metric') -> None:
+        self.metrics.append(metric)
+
+    def expose(self) -> str:
+        return ''.join(metric.expose() for metric in self.metrics)
+
+
+REGISTRY = Registry()
+
+
+def escape(value:str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Metric:
+    '''A family of time series with the same name, one per combination of label values.
+
+    Recording only costs a dict lookup and an addition, nothing is formatted
+    until expose() is called.
+    '''
+    kind = 'untyped'
+
+    def __init__(self, name:str, documentation:str, labels:tuple=(), registry:Registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.children = {} # type: dict[tuple, object] label values -> the series
+        if not self.label_names:
+            self.labels() # exposed from the start, as 0
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        '''The series for these label values (in the order of labels), made on first use'''
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f'{self.name} has labels {self.label_names}, got {values}')
+            child = self.children[values] = self.new_child()
+        return child
+
+    def label_text(self, values:tuple, extra:str='') -> str:
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def expose(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}\n', f'# TYPE {self.name} {self.kind}\n']
+        for values, child in list(self.children.items()):
+            lines.extend(self.sample_lines(values, child))
+        return ''.join(lines)
+
+
+class Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.
+
+    def inc(self, amount:float=1) -> None:
+        self.value += amount
+
+    def set(self, value:float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    '''Only ever goes up, e.g. commands sent or records dropped'''
+    kind = 'counter'
+
+    def new_child(self) -> Value:
+        return Value()
+
+    def inc(self, amount:float=1) -> None:
+        self.labels().inc(amount)
+
+    def sample_lines(self, values:tuple, child:Value) -> list[str]:
+        return [f'{self.name}{self.label_text(values)} {child.value!r}\n']
+
+
+class Gauge(Counter):
+    '''Goes up and down, e.g. the depth of a queue'''
+    kind = 'gauge'
+
+    def set(self, value:float) -> None:
+        self.labels().set(value)
+
+
+class HistogramSeries:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets:tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum = 0.
+
+    def observe(self, value:float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self) -> 'Timer':
+        '''with series.time(): ... observes how long the block took'''
+        return Timer(self)
+
+
+class Timer:
+    __slots__ = ('series', 'start')
+
+    def __init__(self, series:HistogramSeries):
+        self.series = series
+
+    def __enter__(self) -> 'Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.series.observe(time.perf_counter() - self.start)
+
+
+def timed(series:HistogramSeries):
+    '''Decorator observing how long each call of the function takes in series'''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class Histogram(Metric):
+    '''How many observations fell under each of buckets (s by default), with their sum'''
+    kind = 'histogram'
+
+    def __init__(self, name:str, documentation:str, labels:tuple=(), buckets:tuple=DEFAULT_BUCKETS,
+                 registry:Registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def new_child(self) -> HistogramSeries:
+        return HistogramSeries(self.buckets)
+
+    def observe(self, value:float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> Timer:
+        return self.labels().time()
+
+    def sample_lines(self, values:tuple, child:HistogramSeries) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), list(child.counts)):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{self.label_text(values, le)} {cumulative}\n')
+        lines.append(f'{self.name}_sum{self.label_text(values)} {child.sum!r}\n')
+        lines.append(f'{self.name}_count{self.label_text(values)} {cumulative}\n')
+        return lines
+
+
+class MetricsFile:
+    '''Rewrites the metrics to a file every interval seconds, atomically, e.g. for node_exporter's textfile collector'''
+    def __init__(self, path:str, interval:float=10, registry:Registry=REGISTRY):
+        self.path = path
+        self.interval = interval # s
+        self.registry = registry
+        self.task = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.write() # the last values
+
+    def write(self) -> None:
+        tmp_file = f'{self.path}.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(self.registry.expose())
+        os.replace(tmp_file, self.path)
+
+    async def run(self) -> None:
+        while True:
+            self.write()
+            await asyncio.sleep(self.interval)
+
+
+class MetricsServer:
+    '''Answers GET requests on address (unix:/path or [tcp:]host:port, see rcserver.parse_address) with the metrics,
+    so that they only cost anything when they are scraped'''
+    def __init__(self, address:str, registry:Registry=REGISTRY):
+        self.address = parse_address(address)
+        self.registry = registry
+        self.server = None
+        self.connections = {} # type: dict[asyncio.Task, asyncio.StreamWriter]
+
+    async def start(self) -> None:
+        if self.address[0] == 'unix':
+            path = self.address[1]
+            if os.path.exists(path):
+                os.remove(path) # left over by a process that did not stop cleanly
+            umask = os.umask(0o077) # only this user may connect
+            try:
+                self.server = await asyncio.start_unix_server(self.handle, path)
+            finally:
+                os.umask(umask)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.address[1], self.address[2])
+
+    async def close(self) -> None:
+        self.server.close()
+        connections = dict(self.connections)
+        for writer in connections.values():
+            writer.close()
+        await asyncio.gather(*connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                message = await read_http(reader)
+                if message is None:
+                    break
+                first, headers, _ = message
+                data = self.registry.expose().encode() if first.split(' ', 2)[0] == 'GET' else b''
+                status = '200 OK' if data else '405 Method Not Allowed'
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+
+async def start_exporters(path:str=None, address:str=None) -> list:
+    '''Starts a MetricsFile on path and a MetricsServer on address, for those that are given'''
+    exporters = []
+    if path:
+        exporters.append(MetricsFile(path))
+        exporters[-1].start()
+    if address:
+        exporters.append(MetricsServer(address))
+        await exporters[-1].start()
+    return exporters
@@ -1,13 +1,69 @@
 import asyncio
 import logging
 logging.basicConfig(level=logging.INFO)
-import queue
+import os
+import re
+import signal
+import time
+from apptree import AppRegistry, load_topology
+from dispatch import Dispatcher
+from scheduler import CommandScheduler
+from rcserver import RCServer
+from runregistry import RunRegistry, open_registry
+from checkpoint import Checkpointer
+from healthmon import HealthMonitor
+from fsm import TRANSITIONS, COMPOSITES, AVAILABLE_COMMANDS, PLANS
+from simulation import SimulatedApps
+from metrics import Counter, Histogram, start_exporters
+from tracing import TRACER
 
-class RunManager:
-    '''A VERY basic run manager that just stores a number and type'''
+DEFAULT_TOPOLOGY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'np04_coldbox.json')
+DEFAULT_RUN_DB = os.path.expanduser('~/.local/share/text-rc/runs.sqlite')
+DEFAULT_CHECKPOINT_DIR = os.path.expanduser('~/.local/share/text-rc/checkpoints')
+DEFAULT_LOG_DIR = os.path.expanduser('~/.local/share/text-rc/logs')
+DEFAULT_TRACE_DIR = os.path.expanduser('~/.local/share/text-rc/traces')
+
+COMMAND_SECONDS = Histogram('rc_command_duration_seconds', 'Time to take all the apps through a transition',
+                            ('partition', 'command', 'outcome'))
+STATE_CHANGES = Counter('rc_state_changes_total', 'Changes of state of the RC', ('partition', 'from_state', 'to_state'))
+APP_COMMAND_SECONDS = Histogram('rc_app_command_duration_seconds', 'Time for one app to do one command',
+                                ('partition', 'command'))
+APP_COMMAND_FAILURES = Counter('rc_app_command_failures_total', 'Commands that an app failed, timed out or was cancelled',
+                               ('partition', 'command'))
+
+class Notifier:
+    '''Keeps a list of callbacks per topic and calls them when something happens on that topic'''
     def __init__(self):
+        self.subscribers = {} # type: dict[str, list]
+
+    def subscribe(self, topic:str, callback) -> None:
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def unsubscribe(self, topic:str, callback) -> None:
+        callbacks = self.subscribers.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def notify(self, topic:str, *args) -> None:
+        for callback in list(self.subscribers.get(topic, [])):
+            try:
+                callback(*args)
+            except Exception:
+                # A broken subscriber should never stop a transition
+                logging.getLogger("RC").exception(f'Subscriber {callback} failed on \'{topic}\'')
+
+class RunManager(Notifier):
+    '''A VERY basic run manager that just stores a number and type, and keeps the history in a RunRegistry if it has one'''
+    def __init__(self, registry:RunRegistry=None, partition:str=None):
+        super().__init__()
+        self.registry = registry
+        self.partition = partition
         self.run_num = 0
         self.run_type = "STOPPED"
+        if registry is not None:
+            last = registry.last_run(partition)
+            if last is not None:
+                self.run_num = last[0] # numbering carries on where the previous process left it
 
     def get_run_number(self):
         return self.run_num
@@ -16,42 +72,73 @@ class RunManager:
         return self.run_type
 
     def new_run(self):
-        self.run_num += 1
         self.run_type = "TEST"          #All runs are tests
+        if self.registry is not None:
+            self.run_num = self.registry.new_run(self.partition, self.run_type)
+        else:
+            self.run_num += 1
+        self.notify('run', self.run_num, self.run_type)
     
     def end_run(self):
         self.run_type = "STOPPED"
+        if self.registry is not None:
+            self.registry.end_run(self.run_num)
+        self.notify('run', self.run_num, self.run_type)
+
+    def record(self, command:str, in_state:str, out_state:str, outcome:str, start:float) -> None:
+        '''Adds a transition to the history, outcome is 'ok', 'failed' or 'aborted' '''
+        end = time.time()
+        COMMAND_SECONDS.labels(self.partition or '', command, outcome).observe(end - start)
+        if self.registry is not None:
+            self.registry.record(self.partition, command, in_state, out_state, outcome, start, end)
+
+TIMEOUT_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def parse_timeout(value, default:float) -> float:
+    '''Seconds from a number or a string like '30', '2.5s', '500ms' or '5m', default if it is empty'''
+    if value is None or value == '':
+        return default
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = re.fullmatch(r'\s*(\d+(?:\.\d*)?|\.\d+)\s*(ms|s|m|h)?\s*', value)
+        if match is None:
+            raise ValueError(f'Invalid timeout \'{value}\', expected e.g. 30, 2.5s, 500ms or 5m')
+        seconds = float(match[1]) * TIMEOUT_UNITS[match[2] or 's']
+    if seconds <= 0:
+        raise ValueError(f'Timeout must be positive, got \'{value}\'')
+    return seconds
 
-class RC:
-    def __init__(self, timeout:int=1):
-        self.runmgr = RunManager()
+class RC(Notifier):
+    '''Topics: 'state' (new state), 'commands' (available commands),
+    'tree' (the AppRegistry, when nodes were added, removed or expanded), 'tree_delta' (the AppNodes whose state changed)
+    and 'progress' (a dispatch.Progress, while a command is being sent to the apps)'''
+    def __init__(self, timeout:int=1, topology:str=DEFAULT_TOPOLOGY, max_concurrency:int=64, command_timeout:float=60,
+                 partition:str=None, run_db:str=None, checkpoint_dir:str=None, backend=None):
+        '''topology is a configuration file or a Topology, backend talks to the apps (see simulation.SimulatedApps)'''
+        super().__init__()
+        self.partition = partition # name of this RC when there are several in the process, also the root of its tree
+        self.runmgr = RunManager(open_registry(run_db) if run_db else None, partition)
         self.timeout = timeout # s
-        self.log = logging.getLogger("RC")
+        self.command_timeout = command_timeout # s, for the commands sent without a timeout
+        self.backend = backend if backend is not None else SimulatedApps(latency=timeout*0.1)
+        self.dispatcher = Dispatcher(self.send_to_app, max_concurrency)
+        # Commands for which some parts of the tree have to go first, as a list of children of the root.
+        # Children of the root that are not listed get the command last, all together.
+        self.dispatch_order = {
+            'start': ['daq', 'wibs'],                # dataflow has to be ready before the wibs send anything
+            'stop_trigger_sources': ['wibs', 'daq'], # and the wibs have to stop before dataflow does
+        } # type: dict[str, list[str]]
+        self.log = logging.getLogger("RC" if partition is None else f'RC.{partition}')
+        if partition is not None:
+            self.log.addFilter(self.tag_partition)
+        self.scheduler = CommandScheduler(self.execute, log=self.log)
         # log_handle = logging.FileHandler("rc.log")
         # self.log.addHandler(log_handle)
 
-        self.state = 'none'
-        self.none_state_tree = {
-            'np04_coldbox': {
-                'state': 'none',
-                'children': [
-                    {
-                        'wibs': {
-                            'state': 'none',
-                            'children': []
-                        }
-                    },
-                    {
-                        'daq': {
-                            'state': 'none',
-                            'children': []
-                        }
-                    },
-                    
-                ]
-            }
-        } # type: dict[str, dict]
-        self.tree = self.none_state_tree
+        self._state = 'none'
+        self.apps = AppRegistry.from_topology(
+            load_topology(topology) if isinstance(topology, str) else topology, root=partition)
         self.paramdict = {
             'boot': ["timeout"],
             'start_run': ["timeout", "new_rate"],
@@ -69,16 +156,30 @@ class RC:
 
 
         }
+        self.checkpoint = None # type: Checkpointer
+        self.resumed = False   # whether the state and the tree come from a checkpoint, see reconcile()
+        if checkpoint_dir:
+            self.checkpoint = Checkpointer(self, checkpoint_dir)
+            self.resumed = self.checkpoint.restore()
+            self.checkpoint.start()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @state.setter
+    def state(self, state:str) -> None:
+        STATE_CHANGES.labels(self.partition or '', self._state, state).inc()
+        self._state = state
+        self.notify('state', state)
+        self.notify('commands', self.get_available_commands())
+
+    @property
+    def tree(self) -> dict:
+        return self.apps.to_dict()
 
     def get_available_commands(self) -> list[str]:
-        if   self.state == 'none':                    return ['boot']
-        elif self.state == 'initialised':             return ['start_run', 'conf', 'terminate', 'shutdown']
-        elif self.state == 'configured':              return ['start_run', 'scrap', 'shutdown', 'start']
-        elif self.state == 'ready':                   return ['enable_trigger', 'drain_dataflow', 'shutdown']
-        elif self.state == 'trigger_enabled':         return ['disable_trigger', 'shutdown']
-        elif self.state == 'dataflow_drained':        return ['stop_trigger_sources', 'shutdown']
-        elif self.state == 'trigger_sources_stopped': return ['stop', 'shutdown']
-        else: return []
+        return AVAILABLE_COMMANDS.get(self.state, [])
 
     def get_all_commands(self) -> list[str]:
         return [
@@ -97,108 +198,128 @@ class RC:
         ]
 
     
-    def update_app_status(self,out_state) -> None:
-        self.tree = {
-            'np04_coldbox': {
-                'state': out_state,
-                'children': [
-                    {
-                        'wibs': {
-                            'state': out_state,
-                            'children': [
-                                {
-                                    f'wib_00{i}': {
-                                        'state': out_state
-                                    }
-                                    for i in range(8)
-                                }
-                            ]
-                        }
-                    },
-                    {
-                        'daq': {
-                            'state': out_state,
-                            'children': [
-                                {
-                                    f'runp04srv0{i}': {
-                                        'state': out_state
-                                    }
-                                    for i in range(24,28)
-                                },
-                                {
-                                    f'dqmrunp04srv0{i}': {
-                                        'state': out_state
-                                    }
-                                    for i in range(24,28)
-                                },
-                                {
-                                    'dfo': {
-                                        'state': out_state
-                                    }
-                                },
-                                {
-                                    'trigger': {
-                                        'state': out_state
-                                    }
-                                },
-                                {
-                                    f'dataflow{i}': {
-                                        'state': out_state
-                                    }
-                                    for i in range(4)
-                                },
-                                {
-                                    f'dqmdf{i}': {
-                                        'state': out_state
-                                    }
-                                    for i in range(4)
-                                }
-                            ]
-                        }
-                    },
-                    
-                ]
-            }
-        } # type: dict[str, dict]
-    '''    
-    def update_single_app(self, out_state:str, nodepath:str topnode:str, apptype:str, app:str) -> None:
-        nodepath = nodepath.split["/"]              #Nodepath should be formatted like np04_coldbox/daq/dataflow2
-        topnode = nodepath[0]
-        apptype = nodepath[1]
-        app = nodepath[2]                           #There is probably a better way of doing that
-
-        typelist = self.tree[topnode]['children']
-        for item in typelist:                       #Searches the list to find the dict with the right name
-            typecheck = list(item.keys())[0]
-            if typecheck == apptype:
-                typedict = item
-        applist = typedict[apptype]['children']
-        for item in applist:                        #Same but for apps
-            appcheck = list(item.keys())[0]
-            if appcheck == app:
-                appdict = item
-        appdict[app]['state'] = out_state
-    '''
+    def update_app_status(self, out_state:str) -> None:
+        '''Moves every app to out_state'''
+        self.update_apps({app.path: out_state for app in self.apps.leaves()})
+
+    def update_apps(self, states:dict) -> None:
+        '''states maps paths to their new state'''
+        size = len(self.apps)
+        changed = self.apps.set_states(states)
+        if len(self.apps) > size: # some apps were in unexpanded subtrees, which are expanded now
+            self.notify('tree', self.apps)
+        if changed:
+            self.notify('tree_delta', changed)
+
+    def update_single_app(self, nodepath:str, out_state:str) -> None:
+        '''Nodepath should be formatted like np04_coldbox/daq/dataflow2'''
+        self.update_apps({nodepath: out_state})
+
+    def expand_apps(self, nodepath:str) -> None:
+        '''Materialises the children of a node that was loaded lazily'''
+        if self.apps.expand(nodepath):
+            self.notify('tree', self.apps)
+
+    def dispatch_stages(self, command:str) -> list[list[str]]:
+        '''Groups the apps following dispatch_order, each group only gets the command once the previous one is done'''
+        order = self.dispatch_order.get(command, [])
+        stages = {name: [] for name in order}
+        rest = []
+        for child in self.apps.root.children:
+            stages.get(child.name, rest).extend(self.apps.app_paths(child.path))
+        return [stage for stage in [*stages.values(), rest] if stage]
+
+    def tag_partition(self, record:logging.LogRecord) -> bool:
+        '''Records about the partition as a whole count as coming from the root of its tree'''
+        if getattr(record, 'app', None) is None:
+            record.app = self.partition
+        return True
+
+    def app_log(self, path:str) -> logging.LoggerAdapter:
+        '''A logger that tags its records with the app they are about, so the TUI can route them'''
+        return logging.LoggerAdapter(self.log, {'app': path})
+
+    async def send_to_app(self, path:str, command:str, deadline:float=None, **kwargs) -> None:
+        '''Sends one command to one app, which has until deadline (time.monotonic()) to do it'''
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError(f'Deadline already passed, \'{command}\' not sent to {path}')
+        try:
+            with APP_COMMAND_SECONDS.labels(self.partition or '', command).time(), \
+                 TRACER.span(path, 'app', self.partition, command=command):
+                await asyncio.wait_for(self.backend.send(path, command, **kwargs), remaining)
+        except BaseException:
+            APP_COMMAND_FAILURES.labels(self.partition or '', command).inc()
+            raise
+        self.app_log(path).info(f'Done with \'{command}\'')
+
+    async def query_status(self, paths:list[str]) -> dict:
+        '''Asks all the apps at once which state they are in'''
+        return await self.backend.query_status(paths)
+
+    async def reconcile(self) -> None:
+        '''Checks a tree restored from a checkpoint against the apps, and settles the transition that was cut short if any'''
+        reported = await self.query_status(self.apps.app_paths())
+        reported = {path: state for path, state in reported.items() if state is not None} # None: the app does not know
+        self.update_apps({path: state for path, state in reported.items() if state != self.apps.state_of(path)})
+        states = set(reported.values())
+        command = self.state[:-len('ing')]
+        if command in TRANSITIONS:
+            in_state, out_state = TRANSITIONS[command]
+            self.log.warning(f'\'{command}\' was interrupted, the apps are in {sorted(states)}')
+            self.state = out_state if states == {out_state} else in_state
+        elif len(states) == 1 and self.state not in states:
+            self.state = states.pop()
+        elif len(states) > 1:
+            self.log.warning(f'The apps do not agree on a state: {sorted(states)}')
+        self.log.info(f'Resumed in \'{self.state}\'')
+
     def get_required_params(self, command:str) -> list:
         return(self.paramdict[command])
         
-    async def send_command(self, command:str, in_state:str, out_state:str, **kwargs) -> None:
-        import time
-        from rich.progress import track
-        
+    def deadline(self, timeout) -> float:
+        return time.monotonic() + parse_timeout(timeout, self.command_timeout)
+
+    async def send_command(self, command:str, deadline:float=None, **kwargs) -> None:
+        '''Sends command to all the apps, they have until deadline (time.monotonic()), or the timeout kwarg, to do it'''
+        in_state, out_state = TRANSITIONS[command]
         if self.state != in_state:
             raise RuntimeError(f'Cannot send {command} from \'{self.state}\'')
+        if deadline is None:
+            deadline = self.deadline(kwargs.get('timeout'))
         
         self.state = command+'ing'
+        start = time.time()
         words = ""
         for key in kwargs:
             words += f"{key}: {kwargs[key]}\n"
 
         self.log.info(f'Preparing to send \'{command}\'')
         self.log.info(f'\nProvided parameters:\n{words}')
-        for i in track(range(self.timeout*10), description=f"Sending {command}..."):
-            self.log.info(f'Plenty of logs for the command \'{command}\'...')
-            await asyncio.sleep(0.01)  # Simulate work being done
+        try:
+            with TRACER.span(command, 'transition', self.partition, from_state=in_state):
+                result = await self.dispatcher.dispatch(
+                    command,
+                    self.dispatch_stages(command),
+                    deadline=deadline,
+                    on_progress=lambda progress: self.notify('progress', progress),
+                    **kwargs
+                )
+        except asyncio.CancelledError:
+            self.state = in_state
+            self.runmgr.record(command, in_state, out_state, 'aborted', start)
+            self.log.warning(f'\'{command}\' was aborted, the apps may not all be in \'{in_state}\'')
+            raise
+
+        if not result.ok:
+            self.update_apps({
+                **{path: out_state for path in result.succeeded},
+                **{path: 'error'   for path in result.failed},
+            })
+            self.state = in_state
+            self.runmgr.record(command, in_state, out_state, 'failed', start)
+            self.log.error(f'Failed to send {result.summary()}')
+            raise RuntimeError(f'{command} failed on {len(result.failed)} app(s)')
 
         if command == 'start':
             self.runmgr.new_run()
@@ -206,96 +327,107 @@ class RC:
         if command == 'drain_dataflow':
             self.runmgr.end_run()
 
-        if command == 'terminate':
-            self.tree = self.none_state_tree
-        else:
-            self.update_app_status(out_state)
+        self.update_app_status(out_state)
+        self.runmgr.record(command, in_state, out_state, 'ok', start)
         
         self.state = out_state
         self.log.info(f'Sent \'{command}\'')
 
     async def boot(self, **kwargs) -> None:
-        await self.send_command('boot', 'none', 'initialised', **kwargs)
+        await self.send_command('boot', **kwargs)
         
     async def conf(self, **kwargs) -> None:
-        await self.send_command('conf', 'initialised', 'configured', **kwargs)
+        await self.send_command('conf', **kwargs)
 
     async def start(self, **kwargs) -> None:
-        await self.send_command('start', 'configured', 'ready', **kwargs)
+        await self.send_command('start', **kwargs)
         
     async def enable_trigger(self, **kwargs) -> None:
-        await self.send_command('enable_trigger', 'ready', 'trigger_enabled', **kwargs)
+        await self.send_command('enable_trigger', **kwargs)
 
     async def disable_trigger(self, **kwargs) -> None:
-        await self.send_command('disable_trigger', 'trigger_enabled', 'ready', **kwargs)
+        await self.send_command('disable_trigger', **kwargs)
 
     async def drain_dataflow(self, **kwargs) -> None:
-        await self.send_command('drain_dataflow', 'ready', 'dataflow_drained', **kwargs)
+        await self.send_command('drain_dataflow', **kwargs)
 
     async def stop_trigger_sources(self, **kwargs) -> None:
-        await self.send_command('stop_trigger_sources', 'dataflow_drained', 'trigger_sources_stopped', **kwargs)
+        await self.send_command('stop_trigger_sources', **kwargs)
     
     async def stop(self, **kwargs) -> None:
-        await self.send_command('stop', 'trigger_sources_stopped', 'configured', **kwargs)
+        await self.send_command('stop', **kwargs)
         
     async def scrap(self, **kwargs) -> None:
-        await self.send_command('scrap', 'configured', 'initialised', **kwargs)
+        await self.send_command('scrap', **kwargs)
         
     async def terminate(self, **kwargs) -> None:
-        await self.send_command('terminate', 'initialised', 'none', **kwargs)
+        await self.send_command('terminate', **kwargs)
 
 
-    async def execute_maybe(self, cmd, in_state, out_state, **kwargs):
-        try:
-            await self.send_command(cmd, in_state, out_state, **kwargs)
-        except:
-            pass
+    async def execute_plan(self, command:str, **kwargs) -> None:
+        '''Runs the transitions of a composite command that are needed from the current state, stops at the first failure'''
+        target = COMPOSITES[command][0]
+        plan = PLANS.get((self.state, target))
+        if plan is None:
+            raise RuntimeError(f'Cannot send {command} from \'{self.state}\'')
+        deadline = self.deadline(kwargs.get('timeout')) # for the whole plan, not for each step
+        self.log.info(f'\'{command}\' from \'{self.state}\': {" -> ".join(plan) or "nothing to do"}')
+        with TRACER.span(command, 'composite', self.partition, from_state=self.state, plan=plan):
+            for step in plan:
+                await self.send_command(step, deadline=deadline, **kwargs)
             
+    async def execute(self, command:str, **kwargs) -> None:
+        '''Runs one (possibly composite) command, this is what the scheduler calls'''
+        await getattr(self, command)(**kwargs)
+
+    async def dump_trace(self, directory:str=DEFAULT_TRACE_DIR) -> str:
+        '''Writes the spans of the last commands (of all the RCs of the process) to a Chrome trace, returns its name'''
+        filename = await TRACER.dump(directory)
+        self.log.info(f'Trace written to {filename}')
+        return filename
+
+    def submit(self, command:str, **kwargs) -> asyncio.Future:
+        '''Queues command on the scheduler without waiting for it, see CommandScheduler.submit'''
+        return self.scheduler.submit(command, **kwargs)
+
+    async def abort(self) -> bool:
+        '''Cancels the running command and everything queued after it'''
+        return await self.scheduler.abort()
+
     async def shutdown(self, **kwargs) -> None:
-        await self.execute_maybe('disable_trigger',      'trigger_enabled',         'ready'                  )
-        await self.execute_maybe('drain_dataflow',       'ready',                   'dataflow_drained'       )
-        await self.execute_maybe('stop_trigger_sources', 'dataflow_drained',        'trigger_sources_stopped')
-        await self.execute_maybe('stop',                 'trigger_sources_stopped', 'configured'             )
-        await self.execute_maybe('scrap',                'configured',              'initialised'            )
-        await self.execute_maybe('terminate',            'initialised',             'none'                  )
+        await self.execute_plan('shutdown', **kwargs)
         
     async def start_run(self, **kwargs) -> None:
-        await self.execute_maybe('conf',           'initialised', 'configured'     )
-        await self.execute_maybe('start',          'configured',  'ready'          )
-        await self.execute_maybe('enable_trigger', 'ready',       'trigger_enabled')
+        await self.execute_plan('start_run', **kwargs)
             
         
         
 
 
-async def main():
-    from rich.logging import RichHandler
-    import logging
-
-    # logging.basicConfig(
-    #     level="INFO",
-    #     format="%(filename)s:%(lineno)d %(message)s",
-    #     datefmt="[%X]",
-    #     handlers=[RichHandler(rich_tracebacks=True)]
-    # )
-
-    # log = logging.getLogger("main")
-    rc = RC(timeout=4)
-    log_queue = queue.Queue(-1)
-    queue_handler = QueueHandler(queue)
-    log.addHandler(QueueHandler(queue))
-
-    
-    # log.info(f'RC state: \'{rc.state}\', available commands: {rc.get_available_commands()}')
-    import json
-    # log.info(f'RC tree: {json.dumps(rc.tree, indent=2)}')
-    await rc.start()
-    # log.info(f'RC state: \'{rc.state}\', available commands: {rc.get_available_commands()}')
-    # log.info(f'RC tree: {json.dumps(rc.tree, indent=2)}')
-    await rc.stop()
-    # log.info(f'RC state: \'{rc.state}\', available commands: {rc.get_available_commands()}')
-    # log.info(f'RC tree: {json.dumps(rc.tree, indent=2)}')
+async def serve(address:str, topology:str=DEFAULT_TOPOLOGY, health:str=None,
+                metrics_file:str=None, metrics_address:str=None) -> None:
+    '''Runs an RC without a UI, for TUIs and scripts to connect to, polling the health of its apps at health if given,
+    and exporting its metrics to metrics_file and/or metrics_address if given. kill -USR1 dumps a trace (see dump_trace)'''
+    rc = RC(topology=topology, run_db=DEFAULT_RUN_DB, checkpoint_dir=DEFAULT_CHECKPOINT_DIR)
+    if rc.resumed:
+        await rc.reconcile()
+    if health:
+        HealthMonitor(rc, health).start()
+    await start_exporters(metrics_file, metrics_address)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lambda: asyncio.create_task(rc.dump_trace()))
+    await RCServer(rc, address).serve_forever()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    import argparse
+    parser = argparse.ArgumentParser(description='Runs the RC headless, serving it on a local socket')
+    parser.add_argument('address', help='unix:/path/to/socket or [tcp:]host:port, e.g. localhost:7777')
+    parser.add_argument('--topology', default=DEFAULT_TOPOLOGY, help='app tree configuration')
+    parser.add_argument('--health', metavar='HOST:PORT', help='polls the health of the apps at this endpoint')
+    parser.add_argument('--metrics-file', metavar='PATH', help='writes the metrics there every 10s, Prometheus text format')
+    parser.add_argument('--metrics', metavar='ADDRESS', help='serves the metrics over HTTP on unix:/path or host:port')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.address, args.topology, args.health, args.metrics_file, args.metrics))
+    except KeyboardInterrupt:
+        pass
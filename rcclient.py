@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import time
+
+from apptree import AppRegistry
+from dispatch import Progress
+from rc import Notifier
+from rcserver import encode, parse_address
+
+
+class RemoteRunManager(Notifier):
+    '''The run number and type of the RC at the other end of a RemoteRC'''
+    def __init__(self):
+        super().__init__()
+        self.run_num = 0
+        self.run_type = 'STOPPED'
+
+    def get_run_number(self):
+        return self.run_num
+
+    def get_run_type(self):
+        return self.run_type
+
+    def update(self, run_num:int, run_type:str) -> None:
+        self.run_num = run_num
+        self.run_type = run_type
+        self.notify('run', run_num, run_type)
+
+
+class RemoteRC(Notifier):
+    '''Stands in for an RC served by an RCServer, with the same topics and the same methods as far as the TUI is concerned.
+
+    The app tree is rebuilt from the snapshot the server sends on connection,
+    and then kept up to date from the deltas. Log records from the server are
+    re-emitted on self.log, so the handlers attached to it see them as if
+    they had been logged locally.
+    '''
+    def __init__(self, address:str, topics:tuple=('state', 'progress', 'run', 'tree', 'logs')):
+        super().__init__()
+        self.address = parse_address(address)
+        self.topics = list(topics)
+        self.log = logging.getLogger(f'RC@{address}')
+        self.runmgr = RemoteRunManager()
+        self._state = 'none'
+        self.commands = []      # type: list[str]
+        self.all_commands = []  # type: list[str]
+        self.paramdict = {}     # type: dict[str, list[str]]
+        self.apps = None        # type: AppRegistry
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.next_id = 0
+        self.replies = {}       # type: dict[int, asyncio.Future] request id -> its reply
+        self.closing = False
+        self.resumed = False    # the server reconciles its own checkpoints
+
+    async def connect(self) -> None:
+        '''Connects and waits for the snapshot of the server's RC'''
+        if self.address[0] == 'unix':
+            self.reader, self.writer = await asyncio.open_unix_connection(self.address[1])
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.address[1], self.address[2])
+        self.reader_task = asyncio.create_task(self.read())
+        snapshot = await self.request({'op': 'subscribe', 'topics': self.topics})
+        self.on_snapshot(snapshot)
+
+    async def close(self) -> None:
+        self.closing = True
+        self.writer.close()
+        await self.reader_task
+
+    def send(self, request:dict) -> asyncio.Future:
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.replies[self.next_id] = future
+        self.writer.write(encode({'id': self.next_id, **request}))
+        return future
+
+    async def request(self, request:dict) -> dict:
+        reply = await self.send(request)
+        if not reply['ok']:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    async def read(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if 'event' in message and 'id' not in message:
+                    self.on_event(message)
+                else:
+                    future = self.replies.pop(message['id'], None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        except ConnectionError:
+            pass
+        finally:
+            for future in self.replies.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Lost the connection to the RC server'))
+            self.replies.clear()
+            if not self.closing:
+                self.log.error('Disconnected from the RC server')
+
+    # What the TUI uses
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def get_available_commands(self) -> list[str]:
+        return self.commands
+
+    def get_all_commands(self) -> list[str]:
+        return self.all_commands
+
+    def get_required_params(self, command:str) -> list:
+        return self.paramdict[command]
+
+    def submit(self, command:str, **kwargs) -> asyncio.Future:
+        '''Sends command to the server's scheduler, the future is done when the command is'''
+        reply = self.send({'op': 'command', 'command': command, 'params': kwargs})
+        outcome = asyncio.get_running_loop().create_future()
+
+        def done(reply:asyncio.Future) -> None:
+            if reply.exception() is not None:
+                outcome.set_exception(reply.exception())
+            elif reply.result()['ok']:
+                outcome.set_result(None)
+            elif reply.result()['error'] == 'aborted':
+                outcome.cancel()
+            else:
+                outcome.set_exception(RuntimeError(reply.result()['error']))
+        reply.add_done_callback(done)
+        return outcome
+
+    async def abort(self) -> bool:
+        return (await self.request({'op': 'abort'}))['stopped']
+
+    async def dump_trace(self) -> str:
+        '''Has the server write a trace of its last commands, returns the name of the file on the server's side'''
+        return (await self.request({'op': 'trace'}))['filename']
+
+    def expand_apps(self, nodepath:str) -> None:
+        self.send({'op': 'expand', 'path': nodepath}) # the server answers with a 'tree' event
+
+    # Events
+
+    def on_snapshot(self, snapshot:dict) -> None:
+        self.all_commands = snapshot['all_commands']
+        self.paramdict = snapshot['params']
+        self.runmgr.update(*snapshot['run'])
+        self.on_event({'event': 'tree', 'tree': snapshot['tree']})
+        self.on_event({'event': 'commands', 'commands': snapshot['commands']})
+        self.on_event({'event': 'state', 'state': snapshot['state']})
+
+    def on_event(self, message:dict) -> None:
+        event = message['event']
+        if event == 'state':
+            self._state = message['state']
+            self.notify('state', self._state)
+        elif event == 'commands':
+            self.commands = message['commands']
+            self.notify('commands', self.commands)
+        elif event == 'progress':
+            progress = Progress(message['command'], message['total'])
+            progress.acknowledged = message['acknowledged']
+            progress.failed = message['failed']
+            progress.finished = message['finished']
+            progress.start_time = time.monotonic() - message['elapsed']
+            self.notify('progress', progress)
+        elif event == 'run':
+            self.runmgr.update(*message['run'])
+        elif event == 'tree':
+            self.apps = AppRegistry.from_snapshot(message['tree'])
+            self.notify('tree', self.apps)
+        elif event == 'tree_delta':
+            size = len(self.apps)
+            changed = self.apps.set_states(dict(message['states']))
+            if len(self.apps) > size:
+                self.notify('tree', self.apps)
+            if changed:
+                self.notify('tree_delta', changed)
+        elif event == 'logs':
+            for created, levelno, name, app, text in message['records']:
+                self.log.handle(logging.makeLogRecord({
+                    'name': name, 'levelno': levelno, 'levelname': logging.getLevelName(levelno),
+                    'msg': text, 'created': created, 'app': app,
+                }))
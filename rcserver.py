@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+
+def parse_address(address:str) -> tuple:
+    '''('unix', path) or ('tcp', host, port) from 'unix:/path/to/socket', 'tcp:host:port' or 'host:port' '''
+    if address.startswith('unix:'):
+        return ('unix', address[len('unix:'):])
+    if address.startswith('tcp:'):
+        address = address[len('tcp:'):]
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'Invalid address \'{address}\', expected unix:/path or [tcp:]host:port')
+    return ('tcp', host or '127.0.0.1', int(port))
+
+
+def encode(message:dict) -> bytes:
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+class Client:
+    '''One connection to the server, and the topics it subscribed to'''
+    __slots__ = ('reader', 'writer', 'topics', 'name', 'task')
+
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.task = asyncio.current_task() # the one handling its requests
+        self.topics = set() # type: set[str]
+        self.name = str(writer.get_extra_info('peername') or 'local client')
+
+
+class RCServer:
+    '''Serves an RC over a local socket, so that any number of TUIs and scripts can share it.
+
+    The protocol is one JSON object per line. Clients send requests:
+      {"id": 1, "op": "subscribe", "topics": ["state", "progress", "run", "tree", "logs"]}
+      {"id": 2, "op": "command", "command": "conf", "params": {"timeout": "10"}}
+      {"id": 3, "op": "abort"}
+      {"id": 4, "op": "expand", "path": "np04_coldbox/wibs"}
+      {"id": 5, "op": "trace"} (writes a trace of the last commands on the server's side, see tracing.py)
+    and get {"id": ..., "ok": true|false, ...} replies. A subscription is
+    answered with a snapshot of everything, after which the server pushes
+    events: {"event": "state"|"progress"|"run"|"tree"|"tree_delta"|"logs", ...}.
+    Tree deltas only carry the leaves that changed, and log records are sent
+    in batches every log_interval.
+
+    Every event is encoded once, whatever the number of subscribers. Clients
+    that do not keep up (more than max_buffer bytes waiting to be sent to them)
+    are disconnected, they can reconnect to get a fresh snapshot.
+    '''
+    TOPICS = ('state', 'progress', 'run', 'tree', 'logs')
+
+    def __init__(self, rc, address:str, max_buffer:int=4*1024*1024, log_interval:float=0.05):
+        self.rc = rc
+        self.address = parse_address(address)
+        self.max_buffer = max_buffer
+        self.log_interval = log_interval # s
+        self.clients = set() # type: set[Client]
+        self.server = None   # type: asyncio.AbstractServer
+        self.log_records = []
+        self.log_flush = None # type: asyncio.TimerHandle
+        self.loop = None
+        self.log_handler = None
+        self.disconnected = 0 # slow clients that were dropped
+        self.callbacks = {
+            'state':      self.on_state,
+            'commands':   self.on_commands,
+            'progress':   self.on_progress,
+            'tree':       self.on_tree,
+            'tree_delta': self.on_tree_delta,
+        }
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        if self.address[0] == 'unix':
+            path = self.address[1]
+            if os.path.exists(path):
+                os.remove(path) # left over by a server that did not stop cleanly
+            umask = os.umask(0o077) # only this user may connect
+            try:
+                self.server = await asyncio.start_unix_server(self.handle, path)
+            finally:
+                os.umask(umask)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.address[1], self.address[2])
+        for topic, callback in self.callbacks.items():
+            self.rc.subscribe(topic, callback)
+        self.rc.runmgr.subscribe('run', self.on_run)
+        self.log_handler = ForwardHandler(self)
+        self.rc.log.addHandler(self.log_handler)
+        self.rc.log.info(f'Serving on {":".join(str(part) for part in self.address[1:])}')
+
+    async def close(self) -> None:
+        for topic, callback in self.callbacks.items():
+            self.rc.unsubscribe(topic, callback)
+        self.rc.runmgr.unsubscribe('run', self.on_run)
+        self.rc.log.removeHandler(self.log_handler)
+        self.server.close()
+        clients = list(self.clients)
+        for client in clients:
+            client.writer.close()
+        await asyncio.gather(*[client.task for client in clients], return_exceptions=True)
+        await self.server.wait_closed()
+        if self.address[0] == 'unix' and os.path.exists(self.address[1]):
+            os.remove(self.address[1])
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    # Sending
+
+    def send(self, client:Client, data:bytes) -> None:
+        if client.writer.is_closing():
+            return
+        if client.writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.disconnected += 1
+            self.rc.log.warning(f'{client.name} is not keeping up, disconnecting it')
+            client.writer.close()
+            return
+        client.writer.write(data)
+
+    def broadcast(self, topic:str, message:dict) -> None:
+        data = None
+        for client in self.clients:
+            if topic in client.topics:
+                data = data or encode(message) # only encoded if someone listens, and only once
+                self.send(client, data)
+
+    def snapshot(self) -> dict:
+        rc = self.rc
+        return {
+            'event': 'snapshot',
+            'state': rc.state,
+            'commands': rc.get_available_commands(),
+            'all_commands': rc.get_all_commands(),
+            'params': rc.paramdict,
+            'run': [rc.runmgr.get_run_number(), rc.runmgr.get_run_type()],
+            'tree': rc.apps.snapshot(),
+        }
+
+    # RC events
+
+    def on_state(self, state:str) -> None:
+        self.broadcast('state', {'event': 'state', 'state': state})
+
+    def on_commands(self, commands:list) -> None:
+        self.broadcast('state', {'event': 'commands', 'commands': commands})
+
+    def on_progress(self, progress) -> None:
+        self.broadcast('progress', {
+            'event': 'progress',
+            'command': progress.command,
+            'total': progress.total,
+            'acknowledged': progress.acknowledged,
+            'failed': progress.failed,
+            'elapsed': time.monotonic() - progress.start_time,
+            'finished': progress.finished,
+        })
+
+    def on_run(self, run_num:int, run_type:str) -> None:
+        self.broadcast('run', {'event': 'run', 'run': [run_num, run_type]})
+
+    def on_tree(self, apps) -> None:
+        self.broadcast('tree', {'event': 'tree', 'tree': apps.snapshot()})
+
+    def on_tree_delta(self, nodes:list) -> None:
+        states = [[node.path, node.state] for node in nodes if not node.children] # the rest follows from them
+        if states:
+            self.broadcast('tree', {'event': 'tree_delta', 'states': states})
+
+    def add_log(self, record:list) -> None:
+        self.log_records.append(record)
+        if self.log_flush is None:
+            self.log_flush = self.loop.call_later(self.log_interval, self.flush_logs)
+
+    def flush_logs(self) -> None:
+        self.log_flush = None
+        records, self.log_records = self.log_records, []
+        self.broadcast('logs', {'event': 'logs', 'records': records})
+
+    # Requests
+
+    async def handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        client = Client(reader, writer)
+        self.clients.add(client)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    reply = await self.request(client, request)
+                except Exception as e:
+                    reply = {'id': None, 'ok': False, 'error': f'Bad request: {e}'}
+                if reply is not None:
+                    self.send(client, encode(reply))
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def request(self, client:Client, request:dict) -> dict:
+        '''The reply to a request, None if it comes later'''
+        rid = request.get('id')
+        op = request.get('op')
+        if op == 'subscribe':
+            topics = request.get('topics', self.TOPICS)
+            unknown = set(topics) - set(self.TOPICS)
+            if unknown:
+                return {'id': rid, 'ok': False, 'error': f'Unknown topics {sorted(unknown)}'}
+            client.topics = set(topics)
+            return {'id': rid, 'ok': True, **self.snapshot()}
+        if op == 'command':
+            command = request.get('command')
+            if command not in self.rc.get_all_commands():
+                return {'id': rid, 'ok': False, 'error': f'Unknown command \'{command}\''}
+            params = {str(key): str(value) for key, value in request.get('params', {}).items()}
+            try:
+                future = self.rc.submit(command, **params)
+            except RuntimeError as e:
+                return {'id': rid, 'ok': False, 'error': str(e)}
+            future.add_done_callback(lambda future: self.send(client, encode(self.outcome(rid, future))))
+            return None
+        if op == 'abort':
+            return {'id': rid, 'ok': True, 'stopped': await self.rc.abort()}
+        if op == 'expand':
+            self.rc.expand_apps(request['path'])
+            return {'id': rid, 'ok': True}
+        if op == 'trace':
+            return {'id': rid, 'ok': True, 'filename': await self.rc.dump_trace()}
+        return {'id': rid, 'ok': False, 'error': f'Unknown op \'{op}\''}
+
+    @staticmethod
+    def outcome(rid, future:asyncio.Future) -> dict:
+        if future.cancelled():
+            return {'id': rid, 'ok': False, 'error': 'aborted'}
+        if future.exception() is not None:
+            return {'id': rid, 'ok': False, 'error': str(future.exception())}
+        return {'id': rid, 'ok': True}
+
+
+class ForwardHandler(logging.Handler):
+    '''Hands the records logged by RC to the server, from whichever thread they are logged'''
+    def __init__(self, server:RCServer):
+        super().__init__()
+        self.server = server
+
+    def emit(self, record:logging.LogRecord) -> None:
+        try:
+            entry = [record.created, record.levelno, record.name, getattr(record, 'app', None), record.getMessage()]
+            self.server.loop.call_soon_threadsafe(self.server.add_log, entry)
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,153 @@
+import asyncio
+import atexit
+import os
+import sqlite3
+import time
+
+
+class RunRegistry:
+    '''Every run and every transition, kept in an SQLite database in WAL mode.
+
+    Run numbers come from an AUTOINCREMENT key and are committed and fsynced
+    (synchronous=FULL) before the run starts, so they are never handed out
+    twice, even across crashes of the machine and between processes sharing
+    the database. Transitions are only appended: they are buffered and
+    committed together at most every sync_interval without an fsync of their
+    own (synchronous=NORMAL, which WAL keeps consistent), and the next run
+    start or stop makes them durable too. Runs are indexed by start time and
+    transitions by partition and time, which keeps "the runs of last week"
+    and "the timeline of run N" fast however long the history gets.
+    '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS runs (
+            run_num    INTEGER PRIMARY KEY AUTOINCREMENT,
+            partition  TEXT,
+            run_type   TEXT NOT NULL,
+            start_time REAL NOT NULL,
+            stop_time  REAL
+        );
+        CREATE INDEX IF NOT EXISTS runs_by_start ON runs (start_time);
+        CREATE INDEX IF NOT EXISTS runs_by_partition ON runs (partition, run_num);
+        CREATE TABLE IF NOT EXISTS transitions (
+            partition  TEXT,
+            command    TEXT NOT NULL,
+            in_state   TEXT NOT NULL,
+            out_state  TEXT NOT NULL,
+            outcome    TEXT NOT NULL,
+            start_time REAL NOT NULL,
+            end_time   REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS transitions_by_time ON transitions (partition, start_time);
+    '''
+
+    def __init__(self, path:str, sync_interval:float=1.0):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.sync_interval = sync_interval # s, longest time a transition stays in memory only
+        self.db = sqlite3.connect(path, isolation_level=None, timeout=10) # transactions are explicit
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(self.SCHEMA)
+        self.pending = [] # transitions not committed yet
+        self.flush_handle = None
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
+    def write(self, statement:str, args:tuple=(), durable:bool=False) -> sqlite3.Cursor:
+        '''Runs statement in the same transaction as the pending transitions, durable waits for the fsync'''
+        self.cancel_flush()
+        if durable:
+            self.db.execute('PRAGMA synchronous=FULL')
+        try:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.executemany('INSERT INTO transitions VALUES (?, ?, ?, ?, ?, ?, ?)', self.pending)
+                cursor = self.db.execute(statement, args) if statement else None
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        finally:
+            if durable:
+                self.db.execute('PRAGMA synchronous=NORMAL')
+        self.pending = []
+        return cursor
+
+    def flush(self) -> None:
+        if self.pending:
+            self.write(None)
+        self.cancel_flush()
+
+    def cancel_flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    # Writing
+
+    def new_run(self, partition:str, run_type:str, t:float=None) -> int:
+        '''Allocates the next run number, it is on disk when this returns'''
+        return self.write('INSERT INTO runs (partition, run_type, start_time) VALUES (?, ?, ?)',
+                          (partition, run_type, t or time.time()), durable=True).lastrowid
+
+    def end_run(self, run_num:int, t:float=None) -> None:
+        self.write('UPDATE runs SET stop_time = ? WHERE run_num = ?', (t or time.time(), run_num), durable=True)
+
+    def record(self, partition:str, command:str, in_state:str, out_state:str, outcome:str, start:float, end:float) -> None:
+        '''Appends a transition, it is committed with the next batch'''
+        self.pending.append((partition, command, in_state, out_state, outcome, start, end))
+        if self.flush_handle is not None:
+            return
+        try:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.sync_interval, self.flush)
+        except RuntimeError:
+            self.flush() # no loop to batch on
+
+    # Reading
+
+    def last_run(self, partition:str=None) -> tuple:
+        '''(run_num, run_type, start_time, stop_time) of the latest run of partition, None if it never had one'''
+        return self.db.execute(
+            'SELECT run_num, run_type, start_time, stop_time FROM runs WHERE partition IS ? ORDER BY run_num DESC LIMIT 1',
+            (partition,)).fetchone()
+
+    def run(self, run_num:int) -> tuple:
+        '''(run_num, partition, run_type, start_time, stop_time), None if there is no such run'''
+        return self.db.execute('SELECT * FROM runs WHERE run_num = ?', (run_num,)).fetchone()
+
+    def runs_between(self, start:float, stop:float=None) -> list[tuple]:
+        '''The runs that started in [start, stop), e.g. runs_between(time.time() - 7*24*3600) for the last week'''
+        return self.db.execute('SELECT * FROM runs WHERE start_time >= ? AND start_time < ? ORDER BY start_time',
+                               (start, float('inf') if stop is None else stop)).fetchall()
+
+    def timeline(self, run_num:int) -> list[tuple]:
+        '''The transitions of the partition of run_num from the one that started the run to the one that ended it'''
+        self.flush()
+        run = self.run(run_num)
+        if run is None:
+            raise KeyError(f'No run {run_num}')
+        _, partition, _, start_time, stop_time = run
+        # The transition that started the run began before the run was allocated, and the last one ends it
+        first = self.db.execute(
+            'SELECT max(start_time) FROM transitions WHERE partition IS ? AND start_time <= ?',
+            (partition, start_time)).fetchone()[0]
+        return self.db.execute(
+            'SELECT command, in_state, out_state, outcome, start_time, end_time FROM transitions '
+            'WHERE partition IS ? AND start_time >= ? AND start_time <= ? ORDER BY start_time',
+            (partition, first if first is not None else start_time, float('inf') if stop_time is None else stop_time)
+        ).fetchall()
+
+
+_opened = {} # type: dict[str, RunRegistry] path -> registry, so that the partitions of a process share one connection
+
+def open_registry(path:str) -> RunRegistry:
+    if path == ':memory:':
+        return RunRegistry(path)
+    path = os.path.abspath(path)
+    if path not in _opened:
+        _opened[path] = RunRegistry(path)
+        atexit.register(_opened[path].close) # commits the last batch
+    return _opened[path]
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+
+class CommandScheduler:
+    '''Runs the commands sent to RC one at a time, in the order they were submitted.
+
+    submit() returns straight away with a future for the outcome, so the
+    callers (typically UI event handlers) never wait for a transition. A
+    command that is already queued is coalesced with the queued copy, and a
+    command that is already running is rejected. abort() cancels the running
+    command, which cancels its outstanding app dispatches, and drops the queue.
+    '''
+    def __init__(self, run, max_pending:int=16, abort_timeout:float=2, log:logging.Logger=None):
+        self.run = run # coroutine function (command, **kwargs) that executes one command
+        self.max_pending = max_pending
+        self.abort_timeout = abort_timeout # s, how long abort() waits for the running command to stop
+        self.pending = OrderedDict() # type: OrderedDict[str, tuple[dict, asyncio.Future]]
+        self.current = None          # name of the running command
+        self.current_task = None     # type: asyncio.Task
+        self.worker = None           # type: asyncio.Task
+        self.wakeup = None           # type: asyncio.Event
+        self.log = log or logging.getLogger('RC')
+
+    @property
+    def busy(self) -> bool:
+        return self.current is not None or bool(self.pending)
+
+    def submit(self, command:str, **kwargs) -> asyncio.Future:
+        '''Queues command, returns a future that is done once it has run'''
+        if command == self.current:
+            raise RuntimeError(f'\'{command}\' is already running')
+        if command in self.pending:
+            self.log.info(f'\'{command}\' is already queued, not queuing it again')
+            return self.pending[command][1]
+        if len(self.pending) >= self.max_pending:
+            raise RuntimeError(f'Too many commands queued, not queuing \'{command}\'')
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(self.forget)
+        self.pending[command] = (kwargs, future)
+        if self.worker is None or self.worker.done():
+            self.wakeup = asyncio.Event()
+            self.worker = loop.create_task(self.work())
+        self.wakeup.set()
+        return future
+
+    @staticmethod
+    def forget(future:asyncio.Future) -> None:
+        # The outcome was already logged by whoever ran the command
+        if not future.cancelled():
+            future.exception()
+
+    async def work(self) -> None:
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            command, (kwargs, future) = self.pending.popitem(last=False)
+            if future.done():
+                continue
+            self.current = command
+            self.current_task = asyncio.create_task(self.run(command, **kwargs))
+            try:
+                future.set_result(await asyncio.shield(self.current_task))
+            except asyncio.CancelledError:
+                if not self.current_task.cancelled():
+                    raise # the worker itself is being cancelled
+                future.cancel()
+            except Exception as e:
+                self.log.error(f'\'{command}\' failed: {e}')
+                future.set_exception(e)
+            finally:
+                self.current = None
+                self.current_task = None
+
+    async def abort(self) -> bool:
+        '''Drops the queued commands and cancels the running one, returns whether it stopped within abort_timeout'''
+        for _, future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        task = self.current_task
+        if task is None:
+            return True
+        self.log.warning(f'Aborting \'{self.current}\'')
+        task.cancel()
+        done, _ = await asyncio.wait([task], timeout=self.abort_timeout)
+        return bool(done)
+
+    async def close(self) -> None:
+        await self.abort()
+        if self.worker is not None:
+            self.worker.cancel()
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from apptree import Topology
+from fsm import TRANSITIONS
+
+
+def synthetic_topology(apps:int, group_size:int=100, name:str='sim') -> Topology:
+    '''A tree of apps apps, half under daq and half under wibs, in groups of group_size'''
+    def groups(prefix:str, count:int) -> list[dict]:
+        full, rest = divmod(count, group_size)
+        entries = []
+        if full:
+            entries.append({'name': prefix + '{:04d}', 'range': [0, full],
+                            'children': [{'name': 'app{:03d}', 'range': [0, group_size]}]})
+        if rest:
+            entries.append({'name': f'{prefix}{full:04d}', 'children': [{'name': 'app{:03d}', 'range': [0, rest]}]})
+        return entries
+    return Topology.parse({'name': name, 'children': [
+        {'name': 'daq',  'children': groups('df',  apps - apps // 2)},
+        {'name': 'wibs', 'children': groups('wib', apps // 2)},
+    ]})
+
+
+def latency_distribution(spec) -> 'callable':
+    '''A function drawing latencies (s) from a random.Random, from a number (fixed) or a string like
+    'fixed:0.1', 'uniform:0.05,0.2', 'exp:0.1' (mean) or 'lognormal:0.1,0.5' (median, sigma)'''
+    if isinstance(spec, (int, float)):
+        return lambda rng: spec
+    kind, _, args = spec.partition(':')
+    try:
+        args = [float(arg) for arg in args.split(',')] if args else []
+        if kind == 'fixed':
+            value, = args
+            return lambda rng: value
+        if kind == 'uniform':
+            low, high = args
+            return lambda rng: rng.uniform(low, high)
+        if kind == 'exp':
+            mean, = args
+            return lambda rng: rng.expovariate(1 / mean)
+        if kind == 'lognormal':
+            median, sigma = args
+            return lambda rng: median * rng.lognormvariate(0, sigma)
+    except ValueError:
+        pass
+    raise ValueError(f'Invalid latency \'{spec}\', expected e.g. 0.1, uniform:0.05,0.2, exp:0.1 or lognormal:0.1,0.5')
+
+
+class SimulatedApps:
+    '''Any number of apps that only exist in this process, for an RC to send its commands to.
+
+    Each command takes a latency drawn from the given distribution, then
+    fails with probability failure_rate, or never answers at all with
+    probability timeout_rate (the RC gives up at its deadline). The apps that
+    succeed move along the state machine, and query_status reports it; the
+    apps that were never sent anything report None (unknown). An RC uses
+    one of these with a fixed latency unless it is given another backend:
+    anything with the same send() and query_status() will do.
+    '''
+    def __init__(self, latency=0.1, failure_rate:float=0., timeout_rate:float=0., seed:int=None):
+        self.latency = latency_distribution(latency)
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.rng = random.Random(seed)
+        self.states = {}  # type: dict[str, str] app path -> its state, for the apps that were sent something
+        self.sent = 0
+        self.logs = None  # type: LogGenerator
+
+    async def send(self, path:str, command:str, **kwargs) -> None:
+        '''Carries out command on the app at path, raises if it fails'''
+        self.sent += 1
+        rng = self.rng
+        draw = rng.random()
+        if draw < self.timeout_rate:
+            await asyncio.get_running_loop().create_future() # hangs until cancelled
+        await asyncio.sleep(self.latency(rng))
+        if draw < self.timeout_rate + self.failure_rate:
+            raise RuntimeError(f'{path} failed to {command}')
+        if command in TRANSITIONS:
+            self.states[path] = TRANSITIONS[command][1]
+
+    async def query_status(self, paths:list[str]) -> dict:
+        '''{path: state} for all of paths at once, in one latency'''
+        await asyncio.sleep(self.latency(self.rng))
+        states = self.states
+        return {path: states.get(path) for path in paths}
+
+    def start_logs(self, log:logging.Logger, paths:list[str], rate:float) -> None:
+        '''Makes the apps at paths log rate lines per second between them on log, until stop_logs()'''
+        self.stop_logs()
+        self.logs = LogGenerator(log, paths, rate, self.rng.random())
+        self.logs.start()
+
+    def stop_logs(self) -> None:
+        if self.logs is not None:
+            self.logs.stop()
+            self.logs = None
+
+
+class LogGenerator(threading.Thread):
+    '''Emits rate log records per second on log, each from one of the apps at paths, from a thread of its own
+    as the apps would. Records are emitted in bursts every tick seconds, about one in fifty is a warning
+    and one in a thousand an error.'''
+    MESSAGES = [
+        'Received {n} fragments from link {k}',
+        'Queue {k} at {n}% occupancy',
+        'Sent trigger decision {n} to dataflow {k}',
+        'Wrote {n} bytes to file {k}',
+        'Heartbeat {n} from {k}',
+    ]
+
+    def __init__(self, log:logging.Logger, paths:list[str], rate:float, seed:float=None, tick:float=0.01):
+        super().__init__(name='log-generator', daemon=True)
+        self.log = log
+        self.paths = paths
+        self.rate = rate # records/s
+        self.tick = tick # s
+        self.rng = random.Random(seed)
+        self.emitted = 0
+        self.stopping = threading.Event()
+
+    def run(self) -> None:
+        log, paths, messages, rng = self.log, self.paths, self.MESSAGES, self.rng
+        start = time.monotonic()
+        while not self.stopping.wait(self.tick):
+            due = int((time.monotonic() - start) * self.rate) - self.emitted # catches up if a burst ran late
+            for _ in range(due):
+                draw = rng.random()
+                level = logging.ERROR if draw < 0.001 else logging.WARNING if draw < 0.02 else logging.INFO
+                log.log(level, rng.choice(messages).format(n=rng.randrange(100000), k=rng.randrange(64)),
+                        extra={'app': rng.choice(paths)})
+            self.emitted += due
+
+    def stop(self) -> None:
+        self.stopping.set()
+        self.join()
+
+
+async def cycle(rc, cycles:int) -> None:
+    '''Takes the RC through boot, start_run and shutdown cycles times, printing how long each took'''
+    for i in range(cycles):
+        for command in ('boot', 'start_run', 'shutdown'):
+            start = time.monotonic()
+            try:
+                await rc.submit(command)
+                outcome = 'ok'
+            except RuntimeError as e:
+                outcome = str(e)
+            print(f'{i}: {command} {time.monotonic() - start:.2f}s {outcome}, now \'{rc.state}\'', flush=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    from rc import RC, parse_timeout
+    parser = argparse.ArgumentParser(description='Runs an RC against simulated apps, with or without the TUI')
+    parser.add_argument('--apps', type=int, default=10000, help='number of apps')
+    parser.add_argument('--group-size', type=int, default=100, help='apps per node above them')
+    parser.add_argument('--latency', default='lognormal:0.05,0.5',
+                        help='per command and app, e.g. 0.1, uniform:0.05,0.2, exp:0.1 or lognormal:0.1,0.5 (s)')
+    parser.add_argument('--failure-rate', type=float, default=0., help='probability that an app fails a command')
+    parser.add_argument('--timeout-rate', type=float, default=0., help='probability that an app never answers')
+    parser.add_argument('--log-rate', type=float, default=0., help='log lines per second from all the apps together')
+    parser.add_argument('--concurrency', type=int, default=1000, help='commands in flight at once')
+    parser.add_argument('--command-timeout', default='60s', help='for each command, e.g. 30s or 2m')
+    parser.add_argument('--seed', type=int, help='for reproducible runs')
+    parser.add_argument('--headless', type=int, metavar='CYCLES', help='no TUI, runs boot, start_run and shutdown CYCLES times')
+    args = parser.parse_args()
+
+    backend = SimulatedApps(args.latency, args.failure_rate, args.timeout_rate, args.seed)
+    rc = RC(topology=synthetic_topology(args.apps, args.group_size), max_concurrency=args.concurrency,
+            command_timeout=parse_timeout(args.command_timeout, 60), run_db=None, backend=backend)
+
+    if args.headless is None:
+        import tui
+        tui.app = tui.NanoRCTUI(rc) # its handlers have to be on rc.log before the apps start logging
+        if args.log_rate:
+            backend.start_logs(rc.log, rc.apps.app_paths(), args.log_rate)
+        tui.app.run()
+    else:
+        rc.log.propagate = False # the logs still cost what they cost, but would drown the timings
+        rc.log.addHandler(logging.NullHandler())
+        if args.log_rate:
+            backend.start_logs(rc.log, rc.apps.app_paths(), args.log_rate)
+        asyncio.run(cycle(rc, args.headless))
+    backend.stop_logs()
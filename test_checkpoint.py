@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+
+from apptree import load_topology
+from rc import RC, DEFAULT_TOPOLOGY
+from simulation import SimulatedApps
+
+
+def make_rc(tmp_path, topology=DEFAULT_TOPOLOGY) -> RC:
+    '''An RC checkpointing to tmp_path, with the topology cache there too rather than in ~/.cache'''
+    return RC(topology=load_topology(str(topology), cache_dir=str(tmp_path / 'cache')), run_db=None,
+              checkpoint_dir=str(tmp_path / 'checkpoints'), backend=SimulatedApps(latency=0))
+
+
+def boot(rc:RC) -> None:
+    async def run() -> None:
+        await rc.submit('boot')
+        await rc.scheduler.close()
+    asyncio.run(run())
+    rc.checkpoint.stop()
+
+
+def other_topology(tmp_path):
+    with open(DEFAULT_TOPOLOGY) as f:
+        config = json.load(f)
+    config['children'][0]['children'][0]['name'] = 'renamed_wib_{:03d}'
+    path = tmp_path / 'other.json'
+    path.write_text(json.dumps(config))
+    return path
+
+
+def test_resumes_from_the_journal(tmp_path):
+    boot(make_rc(tmp_path))
+    rc = make_rc(tmp_path)
+    assert rc.resumed
+    assert rc.state == 'initialised'
+
+
+def test_journal_of_another_topology_is_discarded(tmp_path):
+    boot(make_rc(tmp_path))
+    rc = make_rc(tmp_path, other_topology(tmp_path))
+    assert not rc.resumed
+    assert rc.state == 'none'
+    assert {leaf.state for leaf in rc.apps.leaves()} == {'none'}
+    rc.checkpoint.stop()
+    assert make_rc(tmp_path, other_topology(tmp_path)).resumed is False
+
+
+def test_snapshot_of_another_topology_is_discarded(tmp_path):
+    rc = make_rc(tmp_path)
+    rc.checkpoint.snapshot_every = 1 # the end of the boot makes a snapshot
+    boot(rc)
+    assert os.path.exists(rc.checkpoint.snapshot_file)
+    rc = make_rc(tmp_path, other_topology(tmp_path))
+    assert not rc.resumed
+    assert rc.state == 'none'
+
+
+def test_journal_naming_unknown_apps_is_discarded(tmp_path):
+    rc = make_rc(tmp_path)
+    boot(rc)
+    with open(rc.checkpoint.journal_file) as f:
+        lines = f.readlines()[1:] # as written before journals had a header
+    with open(rc.checkpoint.journal_file, 'w') as f:
+        f.writelines(lines)
+    rc = make_rc(tmp_path, other_topology(tmp_path))
+    assert not rc.resumed
+    assert rc.state == 'none'
@@ -0,0 +1,99 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import deque
+
+_current = contextvars.ContextVar('span', default=None) # id of the span the running code is in, tasks inherit it
+
+
+class Span:
+    '''with tracer.span(...): times the block, as a child of the span it is in'''
+    __slots__ = ('tracer', 'name', 'category', 'track', 'args', 'id', 'parent', 'start', 'token')
+
+    def __init__(self, tracer:'Tracer', name:str, category:str, track:str, args:dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.track = track
+        self.args = args
+        self.id = next(tracer.ids)
+
+    def __enter__(self) -> 'Span':
+        self.parent = _current.get()
+        self.token = _current.set(self.id)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter_ns()
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.args['error'] = 'cancelled' if issubclass(exc_type, asyncio.CancelledError) else repr(exc)
+        self.tracer.spans.append(
+            (self.name, self.category, self.track, self.start, end - self.start, self.id, self.parent, self.args))
+
+
+class Tracer:
+    '''Keeps the last capacity spans in memory, to be dumped on demand as a Chrome trace (chrome://tracing, Perfetto).
+
+    A span is a tuple appended to a bounded deque when it ends, its parent is
+    whichever span was open in the task that started it (asyncio tasks
+    inherit it from the code that created them). In the dump, each track
+    (a partition) is a process, the commands are on its first thread, and
+    the spans of the apps are spread over as many more threads as there were
+    apps busy at once, so that they never overlap.
+    '''
+    def __init__(self, capacity:int=200000):
+        self.spans = deque(maxlen=capacity) # type: deque[tuple] (name, category, track, start ns, duration ns, id, parent id, args)
+        self.ids = itertools.count(1)
+        self.enabled = True
+
+    def span(self, name:str, category:str, track:str=None, **args):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return Span(self, name, category, track or 'rc', args)
+
+    def chrome_trace(self, spans:list[tuple]=None) -> dict:
+        '''The Chrome trace of spans, by default of all the spans in memory'''
+        events = []
+        pids = {}  # type: dict[str, int] track -> its pid
+        lanes = {} # type: dict[str, list[tuple[int, int]]] track -> heap of (end of the last app span, lane)
+        for name, category, track, start, duration, span_id, parent, args in sorted(self.spans if spans is None else spans, key=lambda span: span[3]):
+            pid = pids.setdefault(track, len(pids) + 1)
+            tid = 0
+            if category == 'app':
+                heap = lanes.setdefault(track, [])
+                if heap and heap[0][0] <= start:
+                    tid = heapq.heapreplace(heap, (start + duration, heap[0][1]))[1]
+                else:
+                    tid = len(heap) + 1
+                    heapq.heappush(heap, (start + duration, tid))
+            events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': start / 1000, 'dur': duration / 1000,
+                           'pid': pid, 'tid': tid, 'args': {'id': span_id, 'parent': parent, **args}})
+        for track, pid in pids.items():
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': track}})
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'commands'}})
+            for tid in range(1, len(lanes.get(track, [])) + 1):
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': 'apps'}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    async def dump(self, directory:str) -> str:
+        '''Writes the spans in memory to a new file in directory, returns its name.
+        Only copying them happens on the event loop, sorting and encoding them can take seconds.'''
+        return await asyncio.to_thread(self.write, list(self.spans), directory)
+
+    def write(self, spans:list[tuple], directory:str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        filename = os.path.join(directory, time.strftime('trace-%Y%m%d-%H%M%S', time.localtime(now)) + f'.{int(now * 1000) % 1000:03d}.json')
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(spans), f, separators=(',', ':'))
+        return filename
+
+
+TRACER = Tracer()
@@ -1,23 +1,38 @@
 import sys
 import asyncio
+import atexit
 from datetime import datetime
-from rc import RC
+from rc import RC, DEFAULT_RUN_DB, DEFAULT_CHECKPOINT_DIR, DEFAULT_LOG_DIR
+from rcclient import RemoteRC
+from healthmon import HealthMonitor
+from logstore import LogStore
+from logsearch import LogSearch
+from logingest import LogIngest
+from logformat import LogFormatter
+from logsink import LogSink
+from metrics import Counter, Gauge, Histogram, timed, start_exporters
 
 from rich import print
 from rich.align import Align
 from rich.box import DOUBLE
-from rich.logging import RichHandler
 from rich.panel import Panel
 from rich.text import Text
 from rich.json import JSON
-from rich.console import RenderableType
+from rich.console import RenderableType, Group
+from rich.table import Table
+from rich.progress_bar import ProgressBar
 from rich.markdown import Markdown
 from rich.style import Style
+from rich.segment import Segment
 
 from textual import log, events
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Content, Container, Vertical
 from textual.widget import Widget
+from textual.scroll_view import ScrollView
+from textual.geometry import Size, Region
+from textual._segment_tools import line_crop
+from textual._types import Lines
 from textual.widgets import Button, Header, Footer, Static, Input
 from textual.reactive import reactive, Reactive
 from textual.message import Message, MessageTarget
@@ -30,15 +45,27 @@ from anytree import RenderTree
 logging.basicConfig(level=logging.DEBUG)
 
 
+REFRESH_SECONDS = Histogram('tui_refresh_duration_seconds', 'Time spent refreshing a part of the TUI', ('widget',))
+LOG_QUEUE_DEPTH = Gauge('tui_log_queue_depth', 'Log records waiting to be shown, as of the last refresh of the logs')
+LOG_RECORDS = Counter('tui_log_records_total', 'Log records added to the log display')
+LOG_DROPPED = Counter('tui_log_records_dropped_total', 'Log records shed because the TUI could not keep up')
+
 class TitleBox(Static):
     def __init__(self, title, **kwargs):
         super().__init__(Markdown(f'# {title}'))
 
 class RunNumDisplay(Static): pass
 
+class RCView:
+    '''A widget that shows one RC, and can be pointed at another one (another partition) without being remounted'''
+    def set_rc(self, rc) -> None:
+        self.on_unmount()
+        self.rcobj = rc
+        self.on_mount()
+
 # class RunTypeDisplay(Static): pass
 
-class RunInfo(Static):
+class RunInfo(RCView, Static):
     runnum  = reactive('none')
     runtype = reactive('none')
 
@@ -70,11 +97,9 @@ class RunInfo(Static):
             obj.remove_class("greentextbox")
             obj.add_class("redtextbox")
 
-    def update_runnum(self) -> None:
-        self.runnum = self.rcobj.runmgr.get_run_number()
-
-    def update_runtype(self) -> None:
-        self.runtype = self.rcobj.runmgr.get_run_type()
+    def update_run(self, run_num:int, run_type:str) -> None:
+        self.runnum = run_num
+        self.runtype = run_type
 
     def watch_runtype(self, run:str) -> None:
         self.update_text()
@@ -83,80 +108,146 @@ class RunInfo(Static):
         self.update_text()
 
     def on_mount(self) -> None:
-        self.set_interval(0.1, self.update_runnum)
-        self.set_interval(0.1, self.update_runtype)
+        runmgr = self.rcobj.runmgr
+        self.update_run(runmgr.get_run_number(), runmgr.get_run_type())
+        runmgr.subscribe('run', self.update_run)
+
+    def on_unmount(self) -> None:
+        self.rcobj.runmgr.unsubscribe('run', self.update_run)
 
     def compose(self) -> ComposeResult:
         yield RunNumDisplay(classes="redtextbox")
         
-class LogDisplay(Static):
-    logs = reactive('')
-
+class LogDisplay(ScrollView):
     class SearchAgain(Message):    
         '''The message that tells the searchbar to update itself'''
         def __init__(self, sender: MessageTarget) -> None:
             super().__init__(sender)
 
-    def __init__(self, log_queue, **kwargs):
+    class Dropped(Message):
+        '''The message that tells the parent that more records were dropped'''
+        def __init__(self, sender: MessageTarget, dropped:int) -> None:
+            super().__init__(sender)
+            self.dropped = dropped
+
+    def __init__(self, log_queue, sink=None, capacity:int=100000, eviction:str='oldest', **kwargs):
         super().__init__(**kwargs)
         self.log_queue = log_queue
-        self.handler = RichHandler()
+        self.sink = sink
+        self.ingest = LogIngest(log_queue)
+        self.formatter = LogFormatter(self.ingest)
+        self.messages_per_update = 1000
+        self.dropped = 0
+        self.store = LogStore(capacity, eviction)
+        self.search = LogSearch(self.store)
         self.search_mode = False
-        self.searched_logs = ''
+        self.searched_logs = [] # seqs of the lines matching the search, oldest first
     
     def on_mount(self) -> None:
-        self.set_interval(0.1, self.update_logs) # execute update_logs every second
+        self.formatter.start()
+        self.set_interval(0.1, self.update_logs) # execute update_logs every 0.1 second
+
+    def on_unmount(self) -> None:
+        self.formatter.stop()
     
+    @timed(REFRESH_SECONDS.labels('logs'))
     def update_logs(self) -> None:
-        while True: # drain the queue of logs
-            try:
-                record = self.log_queue.get(block=False)
-                text = self.handler.render_message(record, record.msg)
-                self.logs = f'{text}\n' + self.logs
-            except:
-                break
-
-    def watch_logs(self, logs:str, searched_logs:str) -> None:
+        appended = 0
+        for text, created, level, logger, app, styles in self.formatter.take(self.messages_per_update): # already formatted off the event loop
+            appended += self.store.append(text, created, level, logger, app, styles)
+        LOG_RECORDS.inc(appended)
+        LOG_QUEUE_DEPTH.set(self.log_queue.qsize())
+
+        if self.ingest.dropped != self.dropped:
+            LOG_DROPPED.inc(self.ingest.dropped - self.dropped)
+            self.dropped = self.ingest.dropped
+            self.emit_no_wait(self.Dropped(self, self.dropped))
+
+        if not appended:
+            return
+        self.search.sync() # index the new lines as they arrive, not when someone searches
         if self.search_mode:
             self.emit_no_wait(self.SearchAgain(self)) #Send a message up to the parent
-            self.update(searched_logs)
         else:
-            self.update(logs)
-    
+            self.refresh_lines()
+
+    def displayed_rows(self) -> int:
+        return len(self.searched_logs) if self.search_mode else len(self.store)
+
+    def row_seq(self, row:int) -> int:
+        '''Newest logs are displayed at the top, so row 0 is the last line appended'''
+        if self.search_mode:
+            return self.searched_logs[-1-row]
+        return self.store.next_seq-1-row
+
+    def show_search(self, seqs:list[int]) -> None:
+        self.search_mode = True
+        self.searched_logs = seqs
+        self.refresh_lines()
+
+    def show_all(self) -> None:
+        self.search_mode = False
+        self.searched_logs = []
+        self.refresh_lines()
+
+    def refresh_lines(self) -> None:
+        self.virtual_size = Size(self.store.max_width, self.displayed_rows())
+        self.refresh()
+
+    def render_line(self, y: int) -> list[Segment]:
+        '''Only the lines in the viewport are ever rendered'''
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        row = scroll_y + y
+        if row >= self.displayed_rows():
+            return [Segment(" " * width, self.rich_style)]
+        seq = self.row_seq(row)
+        text, styles = self.store.get(seq), self.store.style(seq)
+        line = list(Text(text, spans=styles).render(self.app.console)) if styles else [Segment(text)]
+        line = Segment.adjust_line_length(line, max(self.store.max_width, width))
+        line = line_crop(line, scroll_x, scroll_x + width, max(self.store.max_width, width))
+        return list(Segment.apply_style(line, self.rich_style))
+
+    def render_lines(self, crop: Region) -> Lines:
+        return self._styles_cache.render_widget(self, crop)
+
     def delete_logs(self) -> None:
-        self.logs = ""
+        self.store.clear()
+        self.searched_logs = []
+        self.refresh_lines()
 
     def save_logs(self) -> None:
-        data = self.logs
-        # self.delete_logs() # dont want to delete_logs here
-        
-        time = str(datetime.now())
-        
-        time = time[:-7]               # Times to the nearest second instead of microsecond
-        time = "-".join(time.split())  # Joins date and time with a hyphen instead of a space
-        time = time.replace(":","")    # chuck the weird ":"
-        filename = f"logs_{time}"
-        try: 
-            with open(filename, "x") as f:
-                f.write(data)
-        except:
-            pass
+        '''Everything is already being streamed to disk, so this only marks the spot'''
+        if self.sink is None:
+            self.store.append('Logs are not being saved, the TUI was started without a log directory')
+        else:
+            filename = self.sink.mark('Logs saved from the TUI')
+            self.store.append(f'Logs saved up to here in {filename}')
+        self.search.sync()
+        self.refresh_lines()
     
 class Logs(Static):
-    def __init__(self, log_queue, **kwargs):
+    def __init__(self, log_queue, sink=None, search_delay:float=0.15, **kwargs):
         super().__init__(**kwargs)
         self.log_queue = log_queue
+        self.sink = sink
+        self.search_delay = search_delay # s, how long the user has to stop typing before we search
+        self.search_timer = None
+        self.app_path = None # only show the logs of this app (and the ones below it) if set
+        self.partitioned = False # set when there are several RCs, each tree root is then a filter of its own
     
     def compose(self) -> ComposeResult:
         yield TitleBox('Logs')
-        yield Input(placeholder='Search logs')
+        yield Input(placeholder='Search logs (filters: level:warning logger:RC app:<path> since:5m)')
+        yield Static(id='log_source')
+        yield Static(id='log_stats')
         yield Horizontal(
             Button("Save logs", id="save_logs"),
             Button("Clear logs", id="delete_logs"),
             classes='horizontalbuttonscontainer'
         )
         yield Vertical(
-            LogDisplay(self.log_queue),
+            LogDisplay(self.log_queue, self.sink),
             id='verticallogs'
         )
 
@@ -168,134 +259,245 @@ class Logs(Static):
 
     async def on_input_changed(self, message: Input.Changed) -> None:
         """A coroutine to handle a text changed message."""
-        await self.begin_search(message.value)
+        if self.search_timer is not None:
+            self.search_timer.stop_no_wait()
+        value = message.value
+        self.search_timer = self.set_timer(self.search_delay, lambda: self.begin_search(value))
+
+    def on_log_display_dropped(self, message:LogDisplay.Dropped) -> None:
+        self.query_one('#log_stats', Static).update(f'[red]{message.dropped} log records dropped (overload)[/red]')
 
     async def on_log_display_search_again(self, message:LogDisplay.SearchAgain) -> None:
         '''To get the right name, we convert from CamelCase to snake_case'''
         textbox = self.query_one(Input)
-        await self.begin_search(textbox.value)
+        self.begin_search(textbox.value)
         
-    async def begin_search(self, message:str) -> None:
-        '''This function is called when the logs update, and when the user types in the box'''
+    def select_app(self, path:str) -> None:
+        '''Restricts the logs to one node of the tree, None (or the root of a lone RC) shows everything again'''
+        self.app_path = path if path and ('/' in path or self.partitioned) else None
+        source = self.query_one('#log_source', Static)
+        source.update(f'Showing the logs of {self.app_path}' if self.app_path else '')
+        self.begin_search(self.query_one(Input).value)
+
+    @timed(REFRESH_SECONDS.labels('search'))
+    def begin_search(self, message:str) -> None:
+        '''This function is called when the logs update, and when the user stops typing in the box'''
         logdisplay = self.query_one(LogDisplay)
+        if self.app_path:
+            message = f'{message} app:{self.app_path}'
         if message:
-            logdisplay.search_mode = True
-            task = asyncio.create_task(self.filter_logs(logdisplay, message))
-            logdisplay.searched_logs = await(task)
-            logdisplay.update(logdisplay.searched_logs)
+            logdisplay.show_search(self.filter_logs(logdisplay, message))
         else:
-            logdisplay.search_mode = False
-            logdisplay.update(logdisplay.logs)
+            logdisplay.show_all()
 
-    async def filter_logs(self, logdisplay, term: str):
-        loglist = logdisplay.logs.split("\n")                                       #Splits the log string into a list of logs
-        #Gets a list of all logs that contain term as a substring (case insensitive)
-        searchedlist = [log for log in loglist if term.lower() in log.lower()]   
-        return "\n".join(searchedlist)                                              #Reformats the list as a string with newlines
+    def filter_logs(self, logdisplay, term: str) -> list[int]:
+        '''Gets the seqs of all logs that contain term as a substring (case insensitive) and pass its filters'''
+        return logdisplay.search.run(term)
 
 
 
 class StatusDisplay(Static): pass
 
-class Status(Static):
+class ProgressDisplay(Static):
+    '''Shows how far the command being sent has got'''
+    def update_progress(self, progress) -> None:
+        verb = 'Sent' if progress.finished else 'Sending'
+        text = f'{verb} {progress.command}: {progress.acknowledged}/{progress.total} apps'
+        if progress.failed:
+            text += f', {progress.failed} failed'
+        if not progress.finished and progress.eta is not None:
+            text += f', ETA {progress.eta:.1f}s'
+        self.update(Group(Text(text), ProgressBar(total=progress.total, completed=progress.acknowledged, width=20)))
+
+class Status(RCView, Static):
     rcstatus = reactive('none')
 
     def __init__(self, rc, **kwargs):
         super().__init__(**kwargs)
         self.rcobj = rc
 
-    def update_rcstatus(self) -> None:
-        self.rcstatus = self.rcobj.state
+    def update_rcstatus(self, state:str) -> None:
+        self.rcstatus = state
 
     def watch_rcstatus(self, status:str) -> None:
         status_display = self.query_one(StatusDisplay)
         nice_status = status.replace('_', ' ').capitalize()
         status_display.update(Markdown(f'# Status\n\n{nice_status}'))
 
+    def update_progress(self, progress) -> None:
+        self.query_one(ProgressDisplay).update_progress(progress)
+
     def on_mount(self) -> None:
-        self.set_interval(0.1, self.update_rcstatus)
+        self.update_rcstatus(self.rcobj.state)
+        self.query_one(ProgressDisplay).update('')
+        self.rcobj.subscribe('state', self.update_rcstatus)
+        self.rcobj.subscribe('progress', self.update_progress)
+
+    def on_unmount(self) -> None:
+        self.rcobj.unsubscribe('state', self.update_rcstatus)
+        self.rcobj.unsubscribe('progress', self.update_progress)
 
     def compose(self) -> ComposeResult:
         # yield TitleBox("Status {}")
         yield StatusDisplay()
+        yield ProgressDisplay()
 
-class TreeDisplay(Static): pass
+class TreeDisplay(ScrollView):
+    '''Draws the app tree one row per node, but only ever renders the rows in the viewport'''
+    class Selected(Message):
+        '''The message that tells the others which node the user clicked on'''
+        def __init__(self, sender: MessageTarget, path:str) -> None:
+            super().__init__(sender)
+            self.path = path
+
+    branch_extend = '│  '
+    branch_mid    = '├─ '
+    branch_last   = '└─ '
+    spacing       = '   '
+    depth_styles  = [Style.parse('bold magenta'), Style.parse('royal_blue1'), Style.parse('green')]
 
-class TreeView(Static):
-    rctree = reactive('')
-    
+    def __init__(self, rc, **kwargs):
+        super().__init__(**kwargs)
+        self.rcobj = rc
+        self.collapsed = set() # paths of the nodes whose children are hidden
+        self.rows = []         # (node, prefix) for each visible row
+        self.row_index = {}    # path -> row
+        self.max_width = 0
+        self.selected = None   # path of the node whose logs are shown
+
+    def set_rc(self, rc) -> None:
+        self.rcobj = rc
+        self.collapsed = set()
+        self.selected = None
+        self.scroll_to(0, 0, animate=False)
+
+    def is_collapsed(self, node) -> bool:
+        return node.path in self.collapsed or node.pending is not None
+
+    def row_text(self, node, prefix:str) -> str:
+        marker = ('▸ ' if self.is_collapsed(node) else '▾ ') if not node.is_leaf() else ''
+        return f'{prefix}{marker}{node.name}: {node.state}'
+
+    @timed(REFRESH_SECONDS.labels('tree'))
+    def rebuild_rows(self) -> None:
+        '''Flattens the visible part of the tree, this is only needed when its shape changes'''
+        self.rows = []
+        self.row_index = {}
+        self.max_width = 0
+        stack = [(self.rcobj.apps.root, '', '')]
+        while stack:
+            node, prefix, child_prefix = stack.pop()
+            self.row_index[node.path] = len(self.rows)
+            self.rows.append((node, prefix))
+            self.max_width = max(self.max_width, len(self.row_text(node, prefix)))
+            if self.is_collapsed(node):
+                continue
+            last = len(node.children) - 1
+            for i, child in reversed(list(enumerate(node.children))):
+                if i == last:
+                    stack.append((child, child_prefix + self.branch_last, child_prefix + self.spacing))
+                else:
+                    stack.append((child, child_prefix + self.branch_mid, child_prefix + self.branch_extend))
+        self.virtual_size = Size(self.max_width, len(self.rows))
+        self.refresh()
+
+    @timed(REFRESH_SECONDS.labels('tree_nodes'))
+    def refresh_nodes(self, nodes:list) -> None:
+        '''Only repaints the rows of the nodes that changed, if they are on screen'''
+        scroll_y = self.scroll_offset.y
+        height = self.size.height
+        for node in nodes:
+            row = self.row_index.get(node.path)
+            if row is None or not scroll_y <= row < scroll_y + height:
+                continue
+            self.max_width = max(self.max_width, len(self.row_text(node, self.rows[row][1])))
+            self.refresh(Region(0, row - scroll_y, self.size.width, 1))
+        if self.virtual_size.width != self.max_width:
+            self.virtual_size = Size(self.max_width, len(self.rows))
+
+    def toggle(self, path:str) -> None:
+        if path in self.collapsed:
+            self.collapsed.remove(path)
+        elif self.rcobj.apps.get(path).pending is not None:
+            self.rcobj.expand_apps(path) # the 'tree' event rebuilds the rows
+            return
+        else:
+            self.collapsed.add(path)
+        self.rebuild_rows()
+
+    def select(self, path:str) -> None:
+        for old in (self.selected, path):
+            row = self.row_index.get(old)
+            if row is not None:
+                self.refresh(Region(0, row - self.scroll_offset.y, self.size.width, 1))
+        self.selected = path
+        self.emit_no_wait(self.Selected(self, path))
+
+    def on_click(self, event: events.Click) -> None:
+        '''Clicking on the ▸/▾ marker folds or unfolds the node, clicking anywhere else on its row selects it'''
+        row = self.scroll_offset.y + event.y
+        if row >= len(self.rows):
+            return
+        node, prefix = self.rows[row]
+        marker_x = len(prefix) - self.scroll_offset.x
+        if not node.is_leaf() and marker_x <= event.x < marker_x + 2:
+            self.toggle(node.path)
+        else:
+            self.select(node.path)
+
+    def render_line(self, y: int) -> list[Segment]:
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        row = scroll_y + y
+        if row >= len(self.rows):
+            return [Segment(" " * width, self.rich_style)]
+        node, prefix = self.rows[row]
+        styles = self.depth_styles
+        label_style = styles[node.depth % len(styles)]
+        if node.path == self.selected:
+            label_style = label_style + Style(reverse=True)
+        line = [
+            Segment(prefix, styles[max(node.depth-1, 0) % len(styles)]),
+            Segment(self.row_text(node, ''), label_style),
+        ]
+        total = max(self.max_width, width)
+        line = Segment.adjust_line_length(line, total)
+        line = line_crop(line, scroll_x, scroll_x + width, total)
+        return list(Segment.apply_style(line, self.rich_style))
+
+    def render_lines(self, crop: Region) -> Lines:
+        return self._styles_cache.render_widget(self, crop)
+
+class TreeView(RCView, Static):
     def __init__(self, rc, **kwargs):
         super().__init__(**kwargs)
         self.rcobj = rc
         
     def compose(self) -> ComposeResult:
         yield TitleBox("Apps")
-        yield Vertical(TreeDisplay(), id='verticaltree')
-    
-    def update_rctree(self) -> None:
-        self.rctree = self.rcobj.tree
+        yield Vertical(TreeDisplay(self.rcobj), id='verticaltree')
+
+    def set_rc(self, rc) -> None:
+        self.query_one(TreeDisplay).set_rc(rc)
+        super().set_rc(rc)
+
+    def update_tree(self, apps) -> None:
+        self.query_one(TreeDisplay).rebuild_rows()
 
-    def watch_rctree(self, tree:dict) -> None:
-        tree_display = self.query_one(TreeDisplay)
-        import json
-        #T = JSON(json.dumps(tree))
-        #tree_display.update(T)
-        nicetree = self.render_json(tree)
-        tree_display.update(nicetree)
+    def update_nodes(self, nodes:list) -> None:
+        self.query_one(TreeDisplay).refresh_nodes(nodes)
 
     def on_mount(self) -> None:
-        self.set_interval(0.1, self.update_rctree)
-
-    def render_json(self, tree:dict):
-        branch_extend = '│  '
-        branch_mid    = '├─ '
-        branch_last   = '└─ '
-        spacing       = '   '
-        rows = []
-        last_cat = False
-        last_app = False
-        col1 = "[bold magenta]"
-        col1end = "[/" + col1[1:]
-        col2 = "[royal_blue1]"
-        col2end = "[/" + col2[1:]
-        col3 = "[green]"
-        col3end = "[/" + col3[1:]
-
-        for tl_key in tree:                                                                 #Loop over top level nodes
-            tlvalue = tree[tl_key]
-            typelist = tlvalue['children']
-            text = f"{col1}{tl_key}: {tlvalue['state']}\n{col1end}"    
-            rows.append(text)
-            for i, typedict in enumerate(typelist):                                         #Loop over the dictionaries that correspond to a category
-                last_cat = (i == len(typelist)-1)
-                typename = list(typedict.keys())[0]    
-                typedata = typedict[typename]                                               #Gets the subdictionary with state and children
-                applist = typedata['children']
-                if last_cat:                                                    #If we are at the end, use the right shape
-                    c1 = branch_last
-                else:
-                    c1 = branch_mid               
-                text = f"{col1}{c1}{col1end}{col2}{typename}: {typedata['state']}\n{col2end}"
-                rows.append(text)
-                for j, appdict in enumerate(applist):                                                     #Loop over the apps themselves
-                    last_app = (j == len(applist)-1)
-                    appname = list(appdict.keys())[0]
-                    appdata = appdict[appname]                                              #Gets the subdictionary that contains the state
-                    if last_cat:
-                        a1 = spacing
-                    else:
-                        a1 = branch_extend
-                    if last_app:
-                        a2 = branch_last
-                    else:
-                        a2 = branch_mid
-                    text = f"{col1}{a1}{col1end}{col2}{a2}{col2end}{col3}{appname}: {appdata['state']}\n{col3end}"
-                    rows.append(text)
-
-        return "".join(rows)
-
-
-class Command(Static):
+        self.update_tree(self.rcobj.apps)
+        self.rcobj.subscribe('tree', self.update_tree)
+        self.rcobj.subscribe('tree_delta', self.update_nodes)
+
+    def on_unmount(self) -> None:
+        self.rcobj.unsubscribe('tree', self.update_tree)
+        self.rcobj.unsubscribe('tree_delta', self.update_nodes)
+
+
+class Command(RCView, Static):
     commands = reactive([])
     
     def __init__(self, rc, **kwargs):
@@ -303,10 +505,14 @@ class Command(Static):
         self.rcobj = rc
         
     def on_mount(self) -> None:
-        self.set_interval(0.1, self.update_buttons)
+        self.update_buttons(self.rcobj.get_available_commands())
+        self.rcobj.subscribe('commands', self.update_buttons)
+
+    def on_unmount(self) -> None:
+        self.rcobj.unsubscribe('commands', self.update_buttons)
 
-    def update_buttons(self) -> None:
-        self.commands = self.rcobj.get_available_commands()
+    def update_buttons(self, commands:list[str]) -> None:
+        self.commands = commands
 
     def watch_commands(self, commands:list[str]) -> None:
         # for cmd self.rcobj.get_all_commands():
@@ -340,12 +546,10 @@ class Command(Static):
         """Event handler called when a button is pressed."""
         button_id = event.button.id
         if button_id == 'quit':
-            method = getattr(self.rcobj, "shutdown")
-            task = asyncio.create_task(method())
-            await task
-            sys.exit(0)
+            await self.app.leave()
         elif button_id == 'abort':
-            sys.exit(0)
+            if not await self.rcobj.abort():
+                self.rcobj.log.error('The running command did not stop in time')
         else:
             app.mount(InputWindow(rc=self.rcobj, command=button_id, id="pop_up"))
 
@@ -372,24 +576,141 @@ class InputWindow(Widget):
         inputs = self.query(Input)
 
         if button_id == "go":
-            method = getattr(self.rcobj, self.command) #If the user presses execute, then find the appropriate nanorc method
             for i in inputs:
                 params[i.id] = i.value
-            task = asyncio.create_task(method(**params))
-            await task
+            try:
+                self.rcobj.submit(self.command, **params) # RC logs how it went
+            except RuntimeError as e:
+                self.rcobj.log.warning(str(e))
         self.remove()
 
+class PartitionGrid(Static):
+    '''One row per partition with its state and run, repainted at most every refresh_interval whatever the traffic'''
+    def __init__(self, rcs:list, refresh_interval:float=0.25, **kwargs):
+        super().__init__(**kwargs)
+        self.rcs = rcs
+        self.current = None
+        self.refresh_interval = refresh_interval
+        self.dirty = True
+
+    def mark_dirty(self, *args) -> None:
+        self.dirty = True
+
+    def on_mount(self) -> None:
+        for rc in self.rcs:
+            rc.subscribe('state', self.mark_dirty)
+            rc.runmgr.subscribe('run', self.mark_dirty)
+        self.set_interval(self.refresh_interval, self.repaint)
+
+    def on_unmount(self) -> None:
+        for rc in self.rcs:
+            rc.unsubscribe('state', self.mark_dirty)
+            rc.runmgr.unsubscribe('run', self.mark_dirty)
+
+    def show(self, current) -> None:
+        self.current = current
+        self.mark_dirty()
+
+    def repaint(self) -> None:
+        if not self.dirty or not self.display:
+            return
+        self.dirty = False
+        table = Table(title='Partitions', expand=True)
+        for column in ('', 'Partition', 'State', 'Run', 'Type'):
+            table.add_column(column)
+        for i, rc in enumerate(self.rcs):
+            runmgr = rc.runmgr
+            table.add_row(
+                str(i + 1), rc.apps.root.name, rc.state.replace('_', ' '),
+                str(runmgr.get_run_number() or ''), runmgr.get_run_type(),
+                style=Style(reverse=True) if rc is self.current else None,
+            )
+        self.update(table)
+
 class NanoRCTUI(App):
     CSS_PATH = "tui.css"
-    BINDINGS = [("d", "toggle_dark", "Toggle dark mode")]
-
-    def __init__(self, rc, **kwargs):
+    BINDINGS = [
+        ("d", "toggle_dark", "Toggle dark mode"),
+        ("left_square_bracket", "switch_partition(-1)", "Previous partition"),
+        ("right_square_bracket", "switch_partition(1)", "Next partition"),
+        ("g", "toggle_grid", "Partitions"),
+        ("t", "dump_trace", "Dump trace"),
+    ]
+
+    def __init__(self, *rcs, health:str=None, metrics_file:str=None, metrics_address:str=None, log_dir:str=None,
+                 **kwargs):
+        '''Shows one RC at a time, out of any number of them (partitions) living in this process
+
+        health is the host:port of the apps' status endpoint, if their health should be polled,
+        metrics_file and metrics_address where to export the metrics, if anywhere (see metrics.py),
+        log_dir where to write the log files (see logsink.py), if anywhere
+        '''
         super().__init__(**kwargs)
-        self.rc = rc
+        self.rcs = list(rcs)
+        self.health = health
+        self.metrics_file = metrics_file
+        self.metrics_address = metrics_address
+        self.monitors = [] # type: list[HealthMonitor]
+        self.rc = self.rcs[0]
         self.log_queue = queue.Queue(-1)
         self.queue_handler = QueueHandler(self.log_queue)
-        self.rc.log.propagate = False
-        self.rc.log.addHandler(self.queue_handler)
+        self.log_sink = LogSink(log_dir) if log_dir else None
+        if self.log_sink is not None:
+            atexit.register(self.log_sink.close) # flush what is still queued when quitting
+        for log in {rc.log for rc in self.rcs}: # one queue and one sink for all the partitions
+            log.propagate = False
+            if self.log_sink is not None:
+                log.addHandler(self.log_sink)
+            log.addHandler(self.queue_handler)
+
+    def on_mount(self) -> None:
+        self.reconciling = [asyncio.create_task(rc.reconcile()) for rc in self.rcs if rc.resumed]
+        if self.health:
+            self.monitors = [HealthMonitor(rc, self.health) for rc in self.rcs]
+            for monitor in self.monitors:
+                monitor.start()
+        self.exporting = asyncio.create_task(start_exporters(self.metrics_file, self.metrics_address))
+        self.query_one(Logs).partitioned = len(self.rcs) > 1
+        self.query_one(PartitionGrid).display = False
+        self.show_partition(self.rc)
+
+    def show_partition(self, rc) -> None:
+        if rc is not self.rc:
+            self.rc = rc
+            for view in (RunInfo, Status, Command, TreeView):
+                self.query_one(view).set_rc(rc)
+        self.query_one(PartitionGrid).show(rc)
+        if len(self.rcs) > 1:
+            self.title = f'RC - {rc.apps.root.name}'
+            self.query_one(Logs).select_app(rc.apps.root.path)
+
+    async def leave(self) -> None:
+        '''Aborts whatever every partition is doing, shuts them all down and exits once they are.
+        Attached to an RC server, only disconnects: the RC goes on for the other clients.'''
+        if any(isinstance(rc, RemoteRC) for rc in self.rcs):
+            await asyncio.gather(*[rc.close() for rc in self.rcs])
+            self.exit()
+            return
+        await asyncio.gather(*[rc.abort() for rc in self.rcs])
+        await asyncio.gather(*[rc.submit('shutdown') for rc in self.rcs if 'shutdown' in rc.get_available_commands()],
+                             return_exceptions=True) # a failed shutdown is already logged, quitting goes on
+        self.exit()
+
+    def action_switch_partition(self, step:int) -> None:
+        i = self.rcs.index(self.rc)
+        self.show_partition(self.rcs[(i + step) % len(self.rcs)])
+
+    def action_toggle_grid(self) -> None:
+        grid = self.query_one(PartitionGrid)
+        grid.display = not grid.display
+        grid.mark_dirty()
+
+    async def action_dump_trace(self) -> None:
+        '''Writes what the last commands spent their time on, for chrome://tracing or Perfetto'''
+        await self.rc.dump_trace() # which logs where it went
+
+    def on_tree_display_selected(self, message:TreeDisplay.Selected) -> None:
+        self.query_one(Logs).select_app(message.path)
 
     def action_toggle_dark(self) -> None:
         """An action to toggle dark mode."""
@@ -402,14 +723,43 @@ class NanoRCTUI(App):
             Status   (rc = self.rc, classes='container'),
             Command  (rc = self.rc, classes='container', id='command'),
             TreeView (rc = self.rc, classes='container', id='tree'),
-            Logs     (log_queue=self.log_queue, classes='container', id='log'),
+            Logs     (log_queue=self.log_queue, sink=self.log_sink, classes='container', id='log'),
             id = 'app-grid'
         )
+        yield PartitionGrid(self.rcs, id='partitions')
         
         yield Header(show_clock=True)
         yield Footer()
 
+async def attach(address:str, **kwargs) -> None:
+    '''Runs the TUI on the RC served at address (see rc.py) rather than on its own, kwargs go to NanoRCTUI'''
+    global app
+    rc = RemoteRC(address)
+    await rc.connect()
+    app = NanoRCTUI(rc, **kwargs)
+    try:
+        await app.run_async()
+    finally:
+        await rc.close()
+
 if __name__ == "__main__":
-    rc = RC()
-    app = NanoRCTUI(rc)
-    app.run()
+    import argparse
+    parser = argparse.ArgumentParser(description='Run control TUI')
+    parser.add_argument('address', nargs='?', help='attach to the RC served there (see rc.py) instead of running one')
+    parser.add_argument('-p', '--partition', action='append', default=[],
+                        help='runs an RC with that name, can be given many times')
+    parser.add_argument('--health', metavar='HOST:PORT', help='polls the health of the apps at this endpoint')
+    parser.add_argument('--metrics-file', metavar='PATH', help='writes the metrics there every 10s, Prometheus text format')
+    parser.add_argument('--metrics', metavar='ADDRESS', help='serves the metrics over HTTP on unix:/path or host:port')
+    args = parser.parse_args()
+    if args.address and (args.partition or args.health):
+        parser.error('-p/--partition and --health are for an RC run by the TUI, the RC at the address has its own')
+    if args.address:
+        asyncio.run(attach(args.address, metrics_file=args.metrics_file, metrics_address=args.metrics,
+                           log_dir=DEFAULT_LOG_DIR))
+    else:
+        rcs = [RC(partition=name, run_db=DEFAULT_RUN_DB, checkpoint_dir=DEFAULT_CHECKPOINT_DIR) for name in args.partition] \
+              or [RC(run_db=DEFAULT_RUN_DB, checkpoint_dir=DEFAULT_CHECKPOINT_DIR)]
+        app = NanoRCTUI(*rcs, health=args.health, metrics_file=args.metrics_file, metrics_address=args.metrics,
+                        log_dir=DEFAULT_LOG_DIR)
+        app.run()